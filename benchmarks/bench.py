@@ -0,0 +1,399 @@
+###############################################################################
+#
+# Author: Lorenzo D. Moon
+# Professor: Anthony Rhodes
+# Course: CS-441
+# Assignment: Programming Assignment 1
+# Description: Benchmarks the solver on fixed puzzle sets and compares the
+#              results against a saved baseline to catch regressions.
+#              For how to use, please read README.md
+#
+###############################################################################
+
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+# Paths are relative to the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOLVER = os.path.join(ROOT, "slidingtiles.py")
+SETS_DIR = os.path.join(ROOT, "benchmarks", "sets")
+BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+LATEST = os.path.join(ROOT, "benchmarks", "results", "latest.json")
+
+# Same order as the -a and -H options of slidingtiles.py
+ALGORITHMS = [
+    "best_first_search",
+    "a_star",
+    "ida_star",
+    "perfect_search",
+    "bidirectional_mm",
+    "ara_star",
+    "hda_star",
+    "parallel_ida_star",
+    "external_a_star",
+    "bfida_star",
+]
+HEURISTICS = [
+    "h1_misplaced",
+    "h2_manhattan",
+    "h3_pnld",
+    "h4_pdb",
+    "h5_linear_conflict",
+    "h6_walking_distance",
+    "h7_perfect",
+]
+
+# Puzzle sets: name -> (size, optimal moves from the goal, count, seed)
+# The files in benchmarks/sets are generated from these once and kept, so
+# every run uses the same puzzles.
+SETS = {
+    "3x3_easy": (9, 10, 20, 1),
+    "3x3_medium": (9, 18, 20, 2),
+    "3x3_hard": (9, 26, 20, 3),
+    "4x4_easy": (16, 20, 5, 4),
+    "4x4_medium": (16, 30, 5, 5),
+    "4x4_hard": (16, 40, 5, 6),
+}
+
+# Combinations run on each board size, (algorithm, heuristic) or
+# (algorithm, heuristic, variant) with a variant from VARIANTS
+# Combinations that need a table that was not built (-H 4) are skipped
+COMBINATIONS = {
+    9: [
+        ("best_first_search", "h2_manhattan"),
+        ("a_star", "h2_manhattan"),
+        ("a_star", "h5_linear_conflict"),
+        ("a_star", "h6_walking_distance"),
+        ("a_star", "h7_perfect"),
+        ("a_star", "h2_manhattan", "cache"),
+        ("ida_star", "h2_manhattan"),
+        ("ida_star", "h5_linear_conflict"),
+        ("perfect_search", "h1_misplaced"),
+        ("bidirectional_mm", "h2_manhattan"),
+        ("ara_star", "h5_linear_conflict"),
+    ],
+    16: [
+        ("best_first_search", "h5_linear_conflict"),
+        ("a_star", "h5_linear_conflict"),
+        ("a_star", "h4_pdb"),
+        ("a_star", "h5_linear_conflict", "cache"),
+        ("ida_star", "h5_linear_conflict"),
+        ("ida_star", "h6_walking_distance"),
+        ("ida_star", "h4_pdb"),
+        ("bidirectional_mm", "h5_linear_conflict"),
+        ("ara_star", "h5_linear_conflict"),
+    ],
+}
+
+# Extra solver options of a combination
+# cache: a new, empty --cache that keeps nothing in memory, so the saved
+# solutions of the earlier puzzles in the set are found in its database
+VARIANTS = {
+    "cache": ["--cache", "--cache-size", "0"],
+}
+
+# Algorithms that must always find the same (shortest) solution length
+OPTIMAL = [
+    "a_star",
+    "ida_star",
+    "perfect_search",
+    "bidirectional_mm",
+    "hda_star",
+    "parallel_ida_star",
+    "external_a_star",
+    "bfida_star",
+]
+
+TIME_LIMIT = 60  # Seconds per solve before it counts as not solved
+MIN_TIME = 0.5  # Search seconds below which timings are too noisy to compare
+
+
+def main(argv):
+    # Usage: bench.py generate | run [OUT] | baseline | compare [NEW] [OPTIONS]
+    if len(argv) == 0 or argv[0] in ("-h", "--help"):
+        help()
+        return 0
+
+    command = argv[0]
+    if command == "generate":
+        generate_sets()
+        return 0
+    if command == "run":
+        out = argv[1] if len(argv) > 1 else LATEST
+        save(run_suite(), out)
+        return 0
+    if command == "baseline":
+        save(run_suite(), BASELINE)
+        return 0
+    if command == "compare":
+        return compare_command(argv[1:])
+
+    sys.stderr.write(f"Unknown command: {command}\n")
+    help()
+    return 2
+
+
+def help():
+    sys.stderr.write("Usage: bench.py COMMAND\n")
+    sys.stderr.write("  generate\t\tRewrite the puzzle sets in benchmarks/sets\n")
+    sys.stderr.write("  run [OUT]\t\tRun the suite (default benchmarks/results/latest.json)\n")
+    sys.stderr.write("  baseline\t\tRun the suite and save it as benchmarks/baseline.json\n")
+    sys.stderr.write("  compare [NEW]\t\tCompare NEW (default latest.json) to the baseline\n")
+    sys.stderr.write("      --baseline FILE\tBaseline to compare against\n")
+    sys.stderr.write("      --tolerance X\tAllowed slowdown of nodes and memory (default 0.05)\n")
+    sys.stderr.write("      --time-tolerance X\tAllowed slowdown of time (default 0.25)\n")
+    sys.stderr.write(f"      --min-time X\tOnly compare times above X seconds (default {MIN_TIME})\n")
+
+
+def generate_sets():
+    # Write every puzzle set with the solver's generator
+    os.makedirs(SETS_DIR, exist_ok=True)
+    for name, (size, distance, count, seed) in SETS.items():
+        filename = os.path.join(SETS_DIR, f"{name}.txt")
+        sys.stderr.write(f"Generating {filename}...\n")
+        subprocess.run(
+            [
+                sys.executable,
+                SOLVER,
+                "-g",
+                str(count),
+                "-s",
+                str(size),
+                "--distance",
+                str(distance),
+                "--seed",
+                str(seed),
+                "--output",
+                filename,
+            ],
+            cwd=ROOT,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+
+
+def run_suite():
+    # Run every combination on every set, one solver process each
+    # Returns {"meta": ..., "results": {"set/algorithm/heuristic": metrics}}
+    results = {}
+    for name, (size, distance, count, seed) in SETS.items():
+        for algorithm, heuristic, *variant in COMBINATIONS[size]:
+            if heuristic == "h4_pdb" and not os.path.exists(
+                os.path.join(ROOT, "tables", f"pdb_{size}.bin")
+            ):
+                sys.stderr.write(f"Skipping {name} {algorithm} {heuristic}: no pdb\n")
+                continue
+            key = "/".join([name, algorithm, heuristic] + variant)
+            sys.stderr.write(f"Running {key}...\n")
+            results[key] = run_one(name, algorithm, heuristic, *variant)
+            sys.stderr.write(f"  {format_metrics(results[key])}\n")
+
+    meta = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+    return {"meta": meta, "results": results}
+
+
+def run_one(name, algorithm, heuristic, variant=None):
+    # Solve one set with one combination and sum up its results
+    # A variant runs in the temporary directory, so its ./cache starts
+    # empty, with ./tables linked in from the repository
+    with tempfile.TemporaryDirectory() as temp:
+        store = os.path.join(temp, "results.jsonl")
+        cwd = ROOT
+        options = []
+        if variant is not None:
+            cwd = temp
+            options = VARIANTS[variant]
+            if os.path.exists(os.path.join(ROOT, "tables")):
+                os.symlink(os.path.join(ROOT, "tables"), os.path.join(temp, "tables"))
+        start = time.perf_counter()
+        subprocess.run(
+            [
+                sys.executable,
+                SOLVER,
+                "--batch",
+                os.path.join(SETS_DIR, f"{name}.txt"),
+                "-a",
+                str(ALGORITHMS.index(algorithm) + 1),
+                "-H",
+                str(HEURISTICS.index(heuristic) + 1),
+                "--workers",
+                "1",
+                "--time-limit",
+                str(TIME_LIMIT),
+                "--results",
+                store,
+            ]
+            + options,
+            cwd=cwd,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        wall = time.perf_counter() - start
+        with open(store, "r") as f:
+            records = [json.loads(line) for line in f]
+
+    solved = [record for record in records if record["steps"] is not None]
+    expanded = sum(record["expanded"] for record in records)
+    search_time = sum(record["time"] for record in records)
+    return {
+        "puzzles": len(records),
+        "solved": len(solved),
+        "steps": sum(record["steps"] for record in solved),
+        "expanded": expanded,
+        "search_time": round(search_time, 6),
+        "nodes_per_sec": round(expanded / search_time, 1) if search_time > 0 else 0.0,
+        "wall_time": round(wall, 6),
+        "peak_rss_kb": max((record["peak_rss_kb"] or 0) for record in records),
+    }
+
+
+def format_metrics(metrics):
+    return (
+        f"solved {metrics['solved']}/{metrics['puzzles']}"
+        f" steps {metrics['steps']} expanded {metrics['expanded']}"
+        f" {metrics['nodes_per_sec']:.0f} nodes/s"
+        f" wall {metrics['wall_time']:.2f}s rss {metrics['peak_rss_kb']}KB"
+    )
+
+
+def save(suite, filename):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, "w") as f:
+        json.dump(suite, f, indent=2, sort_keys=True)
+        f.write("\n")
+    sys.stderr.write(f"Saved {filename}\n")
+
+
+def compare_command(argv):
+    # Parse the compare options, then compare
+    new_file = LATEST
+    baseline_file = BASELINE
+    tolerance = 0.05
+    time_tolerance = 0.25
+    min_time = MIN_TIME
+    i = 0
+    while i < len(argv):
+        if argv[i] == "--baseline":
+            baseline_file = argv[i + 1]
+            i += 1
+        elif argv[i] == "--tolerance":
+            tolerance = float(argv[i + 1])
+            i += 1
+        elif argv[i] == "--time-tolerance":
+            time_tolerance = float(argv[i + 1])
+            i += 1
+        elif argv[i] == "--min-time":
+            min_time = float(argv[i + 1])
+            i += 1
+        else:
+            new_file = argv[i]
+        i += 1
+
+    with open(baseline_file, "r") as f:
+        baseline = json.load(f)["results"]
+    with open(new_file, "r") as f:
+        new = json.load(f)["results"]
+    regressions = compare(baseline, new, tolerance, time_tolerance, min_time)
+    if regressions > 0:
+        print(f"{regressions} regression(s) found")
+        return 1
+    print("No regressions")
+    return 0
+
+
+def compare(baseline, new, tolerance, time_tolerance, min_time):
+    # Print every combination's change and count the regressions
+    # Nodes expanded and memory should not grow by more than tolerance,
+    # time not by more than time_tolerance (it is noisier), and only when
+    # the baseline searched for at least min_time seconds. Fewer puzzles
+    # solved, a different total length from an optimal algorithm, or a
+    # combination of the baseline that did not run, is always a regression.
+    # So is an optimal algorithm with a longer total than another optimal
+    # one on the same set in the new run (see longer_than_optimal).
+    regressions = longer_than_optimal(new)
+    for key in sorted(set(baseline) | set(new)):
+        if key not in new:
+            regressions += 1
+            print(f"MISSING  {key}")
+            continue
+        if key not in baseline:
+            print(f"NEW      {key}: {format_metrics(new[key])}")
+            continue
+        old, cur = baseline[key], new[key]
+        problems = []
+        if cur["solved"] < old["solved"]:
+            problems.append(f"solved {old['solved']} -> {cur['solved']}")
+        algorithm = key.split("/")[1]
+        if (
+            algorithm in OPTIMAL
+            and cur["solved"] == old["solved"]
+            and cur["steps"] != old["steps"]
+        ):
+            problems.append(f"steps {old['steps']} -> {cur['steps']}")
+        checks = [("expanded", tolerance, True), ("peak_rss_kb", tolerance, True)]
+        if old["search_time"] >= min_time:
+            checks.append(("wall_time", time_tolerance, True))
+            checks.append(("nodes_per_sec", time_tolerance, False))
+        for metric, allowed, higher_is_worse in checks:
+            change = relative_change(old[metric], cur[metric])
+            if not higher_is_worse:
+                change = -change
+            if change > allowed:
+                problems.append(f"{metric} {old[metric]} -> {cur[metric]} ({change:+.0%})")
+
+        wall = relative_change(old["wall_time"], cur["wall_time"])
+        if problems:
+            regressions += 1
+            print(f"REGRESS  {key}: " + ", ".join(problems))
+        else:
+            print(f"OK       {key}: wall {wall:+.0%}")
+    return regressions
+
+
+def longer_than_optimal(results):
+    # Print and count the combinations of an optimal algorithm whose total
+    # steps on a set are more than the shortest total of the set
+    # This checks a run on its own, without a baseline. Only combinations
+    # that solved every puzzle are compared, and pnld is left out since it
+    # can overestimate.
+    shortest = {}
+    optimal = {}
+    for key, metrics in results.items():
+        name, algorithm, heuristic = key.split("/")[:3]
+        if algorithm not in OPTIMAL or heuristic == "h3_pnld":
+            continue
+        if metrics["solved"] != metrics["puzzles"]:
+            continue
+        optimal[key] = metrics["steps"]
+        shortest[name] = min(shortest.get(name, metrics["steps"]), metrics["steps"])
+
+    count = 0
+    for key, steps in sorted(optimal.items()):
+        name = key.split("/")[0]
+        if steps > shortest[name]:
+            count += 1
+            print(f"LONGER   {key}: steps {steps}, optimal {shortest[name]}")
+    return count
+
+
+def relative_change(old, new):
+    # How much bigger new is than old, as a fraction of old
+    if old == 0:
+        return 0.0 if new == 0 else float("inf")
+    return (new - old) / old
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -9,91 +9,277 @@
 ###############################################################################
 
 import datetime
+import json
+import math
 import os
 import sys
 
+HEURISTICS = [
+    "h1_misplaced",
+    "h2_manhattan",
+    "h3_pnld",
+    "h4_pdb",
+    "h5_linear_conflict",
+    "h6_walking_distance",
+    "h7_perfect",
+]
+ALGORITHMS = [
+    "best_first_search",
+    "a_star",
+    "ida_star",
+    "perfect_search",
+    "bidirectional_mm",
+    "ara_star",
+    "hda_star",
+    "parallel_ida_star",
+    "external_a_star",
+    "bfida_star",
+]
+# Metrics summarized per combination, and whether their values are exact
+# small integers (otherwise they are put in log sized bins)
+METRICS = [
+    ("steps", True),
+    ("expanded", False),
+    ("time", False),
+    ("peak_rss_kb", False),
+]
+REPORT_BUFFER = 1 << 16  # Bytes of report text held before it is written
 
-def main(argv):
-    HEURISTICS = ["h1_misplaced", "h2_manhattan", "h3_pnld"]
-    ALGORITHMS = ["best_first_search", "a_star"]
-    SIZE = 9
-
-    if argv is not None:
-        SIZE = int(argv)
 
+def main(argv):
+    # Usage: compile_reports.py [SIZE] [--full] [--trace] [--rebuild]
+    #                           [--results PATH]
+    # SIZE only reports that board size, --full also writes every solution
+    # (as its moves, --trace writes every board instead), --rebuild
+    # starts the summary over from the first result and --results reads
+    # a results store other than ./reports/results.jsonl (slidingtiles.py
+    # --results). The summary state is kept next to the store.
+    SIZE = None
+    full = False
+    trace = False
+    rebuild = False
     main_dir = "./reports"
+    results_file = f"{main_dir}/results.jsonl"
+    args = iter(argv)
+    for arg in args:
+        if arg == "--results":
+            results_file = next(args, None)
+            if results_file is None:
+                sys.stderr.write("--results needs a path\n")
+                return
+        elif arg == "--full":
+            full = True
+        elif arg == "--trace":
+            full = True
+            trace = True
+        elif arg == "--rebuild":
+            rebuild = True
+        else:
+            SIZE = int(arg)
+
+    state_file = os.path.splitext(results_file)[0] + "_summary.json"
     time = datetime.datetime.now()
     time = time.strftime("%Y-%m-%d_%H-%M-%S")
     file_name = f"report_{time}.txt"
     lazy_file_name = f"report_{time}_simple.txt"
 
-    # Create the report file
-    with open(f"{main_dir}/{file_name}", "w") as file:
-        file.write(f"Report: {time}\n")
-        file.write("--------------------\n\n")
+    if not os.path.exists(results_file):
+        sys.stderr.write(f"No results found: {results_file}\n")
+        return
+
+    # Only the results added since the last run are read
+    offset, combos = load_state(state_file)
+    if rebuild or offset > os.path.getsize(results_file):
+        offset, combos = 0, {}
+    offset = update_summary(results_file, offset, combos)
+    save_state(state_file, offset, combos)
+    os.makedirs(main_dir, exist_ok=True)
 
     # Create the lazy report file
     with open(f"{main_dir}/{lazy_file_name}", "w") as file:
         file.write(f"Lazy Report: {time}\n")
         file.write("--------------------\n\n")
+        for key in sorted(combos, key=combo_order):
+            algorithm, heuristic, size = key.split("/")
+            if SIZE is not None and int(size) != SIZE:
+                continue
+            combo = combos[key]
+            file.write(f"Algorithm: {format_algorithm(algorithm)}\n")
+            file.write(f"Heuristic: {format_heuristic(heuristic)}\n")
+            file.write(f"Size: {size}\n")
+            file.write(f"Solved: {combo['count'] - combo['failed']}/{combo['count']}\n")
+            for metric, exact in METRICS:
+                summary = Summary(exact, combo[metric])
+                if summary.count == 0:
+                    continue
+                file.write(
+                    f"{metric}: mean {summary.mean():.6g}"
+                    f" median {summary.quantile(0.5):.6g}"
+                    f" p95 {summary.quantile(0.95):.6g} max {summary.max:.6g}\n"
+                )
+            file.write("\n")
 
-    for algorithm in ALGORITHMS:
-        for heuristic in HEURISTICS:
-            dir = main_dir
-            dir += f"/{algorithm}"
-            dir += f"_{heuristic}"
-            dir += f"_{SIZE}"
-            results = ls(dir)
-            avg = 0
-            with open(f"{main_dir}/{file_name}", "a") as file:
-                file.write(f"Algorithm: {format_algorithm(algorithm)}\n")
-                file.write(f"Heuristic: {format_heuristic(heuristic)}\n")
-                file.write(f"Size: {SIZE}\n")
-                sum = 0
-                for result in results:
-                    parsed = parsed_result(dir, result)
-                    sum += int(parsed[1])
-                    file.write(f"{parsed[0]}\n")
-                avg = sum / len(results)
-                file.write(f"Average number of steps: {avg}\n\n")
-
-            # Create a Lazy Report
-            with open(f"{main_dir}/{lazy_file_name}", "a") as file:
-                file.write(f"Algorithm: {format_algorithm(algorithm)}\n")
-                file.write(f"Heuristic: {format_heuristic(heuristic)}\n")
-                file.write(f"Size: {SIZE}\n")
-                file.write(f"Average number of steps: {avg}\n\n")
+    # Create the full report, this one reads every result
+    # The results are read and written one at a time, through a buffer
+    if full:
+        with open(f"{main_dir}/{file_name}", "w", buffering=REPORT_BUFFER) as file:
+            file.write(f"Report: {time}\n")
+            file.write("--------------------\n\n")
+            with open(results_file, "r") as results:
+                for line in results:
+                    record = json.loads(line)
+                    if SIZE is not None and record["size"] != SIZE:
+                        continue
+                    file.write(f"Algorithm: {format_algorithm(record['algorithm'])}\n")
+                    file.write(f"Heuristic: {format_heuristic(record['heuristic'])}\n")
+                    file.write(f"Size: {record['size']}\n")
+                    file.write(f"{parsed_result(record, trace)}\n\n")
 
     return
 
 
-def ls(path):
-    return os.listdir(path)
+def load_state(state_file):
+    # Read where the last summary stopped, and its running totals
+    if not os.path.exists(state_file):
+        return 0, {}
+    with open(state_file, "r") as file:
+        state = json.load(file)
+    return state["offset"], state["combos"]
+
+
+def save_state(state_file, offset, combos):
+    with open(state_file, "w") as file:
+        json.dump({"offset": offset, "combos": combos}, file)
+
+
+def update_summary(results_file, offset, combos):
+    # Add every result after offset to the running summaries
+    # A line that is still being written (no newline yet) is left for later
+    # Returns the offset to start from next time
+    with open(results_file, "rb") as results:
+        results.seek(offset)
+        for line in results:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            record = json.loads(line)
+            key = f"{record['algorithm']}/{record['heuristic']}/{record['size']}"
+            combo = combos.get(key)
+            if combo is None:
+                combo = {"count": 0, "failed": 0}
+                for metric, exact in METRICS:
+                    combo[metric] = Summary(exact).to_dict()
+                combos[key] = combo
+            combo["count"] += 1
+            if record.get("steps") is None:
+                combo["failed"] += 1
+                continue
+            for metric, exact in METRICS:
+                if record.get(metric) is not None:
+                    summary = Summary(exact, combo[metric])
+                    summary.add(record[metric])
+                    combo[metric] = summary.to_dict()
+    return offset
+
+
+def combo_order(key):
+    # Sort by size, then in the order of the lists above
+    algorithm, heuristic, size = key.split("/")
+    return (
+        int(size),
+        ALGORITHMS.index(algorithm) if algorithm in ALGORITHMS else len(ALGORITHMS),
+        HEURISTICS.index(heuristic) if heuristic in HEURISTICS else len(HEURISTICS),
+    )
+
+
+class Summary:
+    # Running summary of one metric: count, sum, max and a histogram
+    # The histogram gives the median and p95 without keeping the values.
+    # exact: the values themselves are the keys (small integers like steps)
+    # otherwise: the keys are log bins, BINS per doubling (within ~4%)
+    BINS = 16
+
+    def __init__(self, exact, data=None):
+        self.exact = exact
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.histogram = {}
+        if data is not None:
+            self.count = data["count"]
+            self.total = data["total"]
+            self.max = data["max"]
+            self.histogram = {int(key): count for key, count in data["histogram"].items()}
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        key = self.key(value)
+        self.histogram[key] = self.histogram.get(key, 0) + 1
+
+    def key(self, value):
+        if self.exact:
+            return int(value)
+        if value <= 0:
+            return -(1 << 30)
+        return round(math.log2(value) * self.BINS)
 
+    def value(self, key):
+        if self.exact:
+            return key
+        if key == -(1 << 30):
+            return 0
+        return 2 ** (key / self.BINS)
 
-def parsed_result(dir, result):
-    # result format is ####_##.txt
-    # Get the first up to the _
-    puzzle = result.split("_")[0]
-    # Get the second up to the .
-    num_moves = result.split("_")[1].split(".")[0]
+    def mean(self):
+        return self.total / self.count
 
-    # Read the entire file into a string
-    with open(f"{dir}/{result}", "r") as file:
-        data = file.read()
+    def quantile(self, q):
+        # Smallest value with at least q of the results at or below it
+        needed = math.ceil(q * self.count)
+        seen = 0
+        for key in sorted(self.histogram):
+            seen += self.histogram[key]
+            if seen >= needed:
+                return min(self.value(key), self.max)
+        return self.max
 
-    puzzle = f"( {puzzle} )->"
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "max": self.max,
+            "histogram": self.histogram,
+        }
 
-    # Convert ] [ to )->(
-    data = data.replace("] [", ")->(")
 
-    # Convert [ to (
-    data = data.replace("[", "(")
+def parsed_result(record, trace=False):
+    # Solution as ( puzzle ) MOVES, or with trace as
+    # ( puzzle )->( step )->( step )...
+    moves = record.get("moves")
+    if moves is None:
+        return f"( {record['puzzle']} ) not solved ({record.get('status')})"
+    if not trace:
+        return f"( {record['puzzle']} ) {moves}\nSteps: {record['steps']}"
+    steps = " )->( ".join(replay(record["puzzle"], moves))
+    return f"( {steps} )\nSteps: {record['steps']}"
 
-    # Convert ] to )
-    data = data.replace("]", ")")
 
-    return [puzzle + data, num_moves]
+def replay(puzzle, moves):
+    # Yield the puzzle, then the board after each move, as text like puzzle
+    # Boards are only made for --trace, the results only keep the moves
+    tiles = puzzle.split()
+    dim = int(len(tiles) ** 0.5)
+    offsets = {"U": -dim, "D": dim, "L": -1, "R": 1}
+    blank = tiles.index("b")
+    yield " ".join(tiles)
+    for move in moves:
+        target = blank + offsets[move]
+        tiles[blank] = tiles[target]
+        tiles[target] = "b"
+        blank = target
+        yield " ".join(tiles)
 
 
 def format_algorithm(algorithm):
@@ -101,6 +287,22 @@ def format_algorithm(algorithm):
         return "Best First Search"
     elif algorithm == "a_star":
         return "A*"
+    elif algorithm == "ida_star":
+        return "IDA*"
+    elif algorithm == "perfect_search":
+        return "Perfect Distance Table"
+    elif algorithm == "bidirectional_mm":
+        return "Bidirectional A* (MM)"
+    elif algorithm == "ara_star":
+        return "Anytime A* (ARA*)"
+    elif algorithm == "hda_star":
+        return "Parallel A* (HDA*)"
+    elif algorithm == "parallel_ida_star":
+        return "Parallel IDA* (root split)"
+    elif algorithm == "external_a_star":
+        return "External Memory A*"
+    elif algorithm == "bfida_star":
+        return "Breadth-First Iterative Deepening A* (BFIDA*)"
 
 
 def format_heuristic(heuristic):
@@ -110,10 +312,15 @@ def format_heuristic(heuristic):
         return "Manhattan Distance"
     elif heuristic == "h3_pnld":
         return "PNLD Distance"
+    elif heuristic == "h4_pdb":
+        return "Pattern Database"
+    elif heuristic == "h5_linear_conflict":
+        return "Linear Conflict"
+    elif heuristic == "h6_walking_distance":
+        return "Walking Distance"
+    elif heuristic == "h7_perfect":
+        return "Perfect Distance"
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        main(None)
-    else:
-        main(sys.argv[1])
+    main(sys.argv[1:])
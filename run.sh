@@ -19,22 +19,13 @@ rm -rf reports
 echo "Generating $rounds solvable puzzles..." 
 $command -g $rounds
 
-# Put the files in solvable into a list of files
-files=$(find solvable -type f -name '?????????.txt' -printf "%f\n")
-
-echo $files
-
-# Run the tests
-for algo in ${algos[@]}; do
-    for heuristic in ${heuristics[@]}; do
-        for file in $files; do
-            echo "$command -a $algo -h $heuristic < $solv_dir$file"
-            $command -a $algo -H $heuristic < $solv_dir$file
-        done
-    done
-done
+# Solve every puzzle with every algorithm and heuristic in parallel
+algo_list=$(IFS=,; echo "${algos[*]}")
+heuristic_list=$(IFS=,; echo "${heuristics[*]}")
+echo "$command --batch $solv_dir -a $algo_list -H $heuristic_list"
+$command --batch $solv_dir -a $algo_list -H $heuristic_list
 
 python3 compile_reports.py
-echo "All tests completed. Results are in the /results/ directory."
+echo "All tests completed. Reports are in the /reports/ directory."
 
 
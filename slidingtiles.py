@@ -12,46 +12,110 @@
 #
 ###############################################################################
 
+import contextlib
 import getopt
 import heapq
+import json
+import mmap
 import os
+import queue
+import shutil
+import sqlite3
+import struct
 import sys
+import tempfile
+import time
+from array import array
+from collections import OrderedDict, deque
 
-import numpy as np
+# numpy, multiprocessing and concurrent.futures are imported where they are
+# used. Together they are most of the import time, and solving a puzzle
+# needs none of them.
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, peak memory is not recorded
+    resource = None
 
 SETTINGS = {}  # Global settings dictionary
 
 
 def main(argv):
-    process_command_line(argv)
-    puzzle = set_puzzle()
-    solution = get_solution(puzzle)
-    show_solution(solution)  # If verbose is set
-    generate_report(puzzle, solution)  # Generate data file of the solution
+    # The search code raises ValueError or FileNotFoundError for a setup
+    # it can't run (see check_combination), only the command line exits
+    try:
+        process_command_line(argv)
+        puzzle = set_puzzle()
+        solution = get_solution(puzzle)
+    except (ValueError, FileNotFoundError, RuntimeError) as error:
+        perror(f"{error}\n")
+        exit(1)
+    show_stats()  # If stats is set
+    if solution is None:
+        perror("No solution found within the time and node limits\n")
+        generate_report(puzzle, None)  # Saved as not solved, like in --batch
+        exit(1)
+    moves = path_moves(solution)  # The solution is kept as its moves from here
+    show_solution(puzzle, moves)  # If verbose is set
+    generate_report(puzzle, moves)  # Generate data file of the solution
     exit(0)
 
 
 def process_command_line(argv):
-    options = "hvs:rH:a:g:"
-    DEFAULT_SIZE = 9
-    HEURISTICS = [h1_misplaced, h2_manhattan, h3_pnld]
-    ALGORITHMS = [best_first_search, a_star]
-    SETTINGS["verbose"] = 0  # Verbose mode
-    SETTINGS["random"] = False  # Random mode
-    SETTINGS["size"] = DEFAULT_SIZE  # Size of the puzzle
-    SETTINGS["Heuristic"] = None  # Heuristic mode
-    SETTINGS["Algorithm"] = None  # Algorithm mode
-    SETTINGS["solve_state"] = solved_state()
+    options = "hvs:rH:a:g:d"
+    long_options = [
+        "help",
+        "verbose",
+        "size=",
+        "random",
+        "heuristic=",
+        "algorithm=",
+        "generate=",
+        "debug",
+        "tt-size=",
+        "weight=",
+        "weight-step=",
+        "cache",
+        "cache-size=",
+        "distance=",
+        "min-distance=",
+        "output=",
+        "seed=",
+        "results=",
+        "build-pdb",
+        "pdb-patterns=",
+        "queue=",
+        "tie-break=",
+        "expand-batch=",
+        "stats",
+        "batch=",
+        "workers=",
+        "search-workers=",
+        "serve",
+        "socket=",
+        "max-pending=",
+        "external-dir=",
+        "external-buffer=",
+        "time-limit=",
+        "node-limit=",
+    ]
+    SETTINGS.update(default_settings())
+    SETTINGS["progress"] = True  # Off in --batch and --serve workers
+    set_solve_state()
     run_generator = 0
+    run_build_pdb = False
+    run_batch_path = None
+    run_serve_socket = None
+    serve_mode = False
 
     try:
-        opts, args = getopt.getopt(argv, options)
+        opts, args = getopt.getopt(argv, options, long_options)
     except getopt.GetoptError:
         help_simple()
         sys.exit(2)
 
     for opt, arg in opts:
-        if opt == "-h":
+        if opt in ("-h", "--help"):
             help()
             sys.exit()
         elif opt in ("-v", "--verbose"):
@@ -59,42 +123,184 @@ def process_command_line(argv):
             verbose(f"Verbose mode: {SETTINGS['verbose']}\n")
         elif opt in ("-r", "--random"):
             SETTINGS["random"] = True
+        elif opt in ("-d", "--debug"):
+            SETTINGS["debug"] = True
+        elif opt == "--stats":
+            SETTINGS["stats"] = True
         elif opt in ("-s", "--size"):
             print(f"Size: {arg}")
-            SETTINGS["size"] = int(arg)
-            SETTINGS["solve_state"] = solved_state()
+            set_size(int(arg))
         elif opt in ("-H", "--heuristic"):
-            heuristic = int(arg)
-            if heuristic < 1 or heuristic > len(HEURISTICS):
-                perror(f"Invalid heuristic: {arg}")
+            # A comma separated list is allowed for --batch
+            SETTINGS["Heuristics"] = []
+            for choice in arg.split(","):
+                heuristic = int(choice)
+                if heuristic < 1 or heuristic > len(HEURISTICS):
+                    perror(f"Invalid heuristic: {arg}")
+                    help_simple()
+                    perror("Run with -h for help")
+                    sys.exit(2)
+                SETTINGS["Heuristics"].append(HEURISTICS[heuristic - 1])
+            SETTINGS["Heuristic"] = SETTINGS["Heuristics"][0]
+        elif opt in ("-a", "--algorithm"):
+            # A comma separated list is allowed for --batch
+            SETTINGS["Algorithms"] = []
+            for choice in arg.split(","):
+                algorithm = int(choice)
+                if algorithm < 1 or algorithm > len(ALGORITHMS):
+                    perror(f"Invalid algorithm: {arg}")
+                    help_simple()
+                    perror("Run with -h for help")
+                    sys.exit(2)
+                SETTINGS["Algorithms"].append(ALGORITHMS[algorithm - 1])
+            SETTINGS["Algorithm"] = SETTINGS["Algorithms"][0]
+        elif opt in ("-g", "--generate"):
+            run_generator = int(arg)
+        elif opt == "--tt-size":
+            SETTINGS["tt_size"] = int(arg)
+        elif opt == "--distance":
+            SETTINGS["distance"] = int(arg)
+        elif opt == "--min-distance":
+            SETTINGS["min_distance"] = int(arg)
+        elif opt == "--output":
+            SETTINGS["output"] = arg
+        elif opt == "--seed":
+            SETTINGS["seed"] = int(arg)
+        elif opt == "--results":
+            SETTINGS["results"] = arg
+        elif opt == "--cache":
+            SETTINGS["cache"] = True
+        elif opt == "--cache-size":
+            SETTINGS["cache_size"] = int(arg)
+        elif opt == "--weight":
+            SETTINGS["weight"] = max(1.0, float(arg))
+        elif opt == "--weight-step":
+            SETTINGS["weight_step"] = float(arg)
+            if SETTINGS["weight_step"] <= 0:
+                perror(f"Invalid weight step: {arg}\n")
                 help_simple()
-                perror("Run with -h for help")
                 sys.exit(2)
-            SETTINGS["Heuristic"] = HEURISTICS[heuristic - 1]
-        elif opt in ("-a", "--algorithm"):
-            algorithm = int(arg)
-            if algorithm < 1 or algorithm > len(ALGORITHMS):
-                perror(f"Invalid algorithm: {arg}")
+        elif opt == "--build-pdb":
+            run_build_pdb = True
+        elif opt == "--pdb-patterns":
+            SETTINGS["pdb_patterns"] = parse_patterns(arg)
+        elif opt == "--queue":
+            if arg not in QUEUES:
+                perror(f"Invalid queue: {arg}\n")
                 help_simple()
-                perror("Run with -h for help")
                 sys.exit(2)
-            SETTINGS["Algorithm"] = ALGORITHMS[algorithm - 1]
-        elif opt in ("-g", "--generate"):
-            run_generator = int(arg)
+            SETTINGS["queue"] = arg
+        elif opt == "--tie-break":
+            if arg not in TIE_BREAKS:
+                perror(f"Invalid tie break: {arg}\n")
+                help_simple()
+                sys.exit(2)
+            SETTINGS["tie_break"] = arg
+        elif opt == "--expand-batch":
+            SETTINGS["expand_batch"] = max(1, int(arg))
+        elif opt == "--batch":
+            run_batch_path = arg
+        elif opt == "--workers":
+            SETTINGS["workers"] = max(1, int(arg))
+        elif opt == "--search-workers":
+            SETTINGS["search_workers"] = max(1, int(arg))
+        elif opt == "--serve":
+            serve_mode = True
+        elif opt == "--socket":
+            serve_mode = True
+            run_serve_socket = arg
+        elif opt == "--max-pending":
+            SETTINGS["max_pending"] = max(1, int(arg))
+        elif opt == "--external-dir":
+            SETTINGS["external_dir"] = arg
+        elif opt == "--external-buffer":
+            SETTINGS["external_buffer"] = max(1, int(arg))
+        elif opt == "--time-limit":
+            SETTINGS["time_limit"] = float(arg)
+        elif opt == "--node-limit":
+            SETTINGS["node_limit"] = int(arg)
 
     # If the user wants to generate solvable puzzles
     # Run the generator and exit
     if run_generator > 0:
-        generate_solvable(run_generator)
+        filename = generate_solvable(run_generator)
         print(f"Generated {run_generator} solvable puzzles of size {SETTINGS['size']}")
-        print("Check the 'solvable' directory for the puzzles")
+        print(f"Check {filename} for the puzzles")
         print("Exiting...")
         exit(0)
 
+    # If the user wants to build the pattern database
+    # Build it, save it and exit
+    if run_build_pdb:
+        patterns = SETTINGS["pdb_patterns"]
+        if patterns is None:
+            patterns = default_patterns(SETTINGS["size"])
+        filename = pdb_filename(SETTINGS["size"])
+        build_pdb(SETTINGS["size"], patterns, filename)
+        print(f"Pattern database for size {SETTINGS['size']} saved to {filename}")
+        exit(0)
+
+    # Lists of algorithms or heuristics only make sense for a batch
+    many = len(SETTINGS["Algorithms"]) > 1 or len(SETTINGS["Heuristics"]) > 1
+    if many and run_batch_path is None:
+        perror("Lists of algorithms or heuristics need --batch\n")
+        help_simple()
+        sys.exit(2)
+
     setup_after_command_line()
+
+    # If the user wants to run a batch
+    # Solve every puzzle with every combination and exit
+    if run_batch_path is not None:
+        run_batch(run_batch_path)
+        exit(0)
+
+    # If the user wants the service
+    # Answer requests until the input ends and exit
+    if serve_mode:
+        run_serve(run_serve_socket, ALGORITHMS, HEURISTICS)
+        exit(0)
     return
 
 
+def default_settings():
+    # The settings before any option is given
+    # process_command_line starts from these, and so does every Solver
+    return {
+        "verbose": 0,  # Verbose mode
+        "random": False,  # Random mode
+        "debug": False,  # Verify incremental heuristics
+        "stats": False,  # Time the parts of the search and print stats
+        "progress": False,  # Print each better ARA* solution as it is found
+        "tt_size": 0,  # IDA* transposition table entries (0 is off)
+        "weight": 3.0,  # First ARA* heuristic weight
+        "weight_step": 0.5,  # How much the ARA* weight drops each pass
+        "cache": False,  # Reuse optimal solutions from ./cache
+        "cache_size": 100000,  # States kept in memory by the cache
+        "queue": "heap",  # Frontier type, heap or bucket
+        "tie_break": "h",  # Order of equal f nodes: h, lifo or fifo
+        "expand_batch": 1,  # Nodes -a 1 and 2 expand at once with numpy (1: off)
+        "pdb_patterns": None,  # Tile partition for --build-pdb
+        "size": 9,  # Size of the puzzle
+        "Heuristic": None,  # Heuristic mode
+        "Algorithm": None,  # Algorithm mode
+        "Heuristics": [],  # All heuristics given (--batch)
+        "Algorithms": [],  # All algorithms given (--batch)
+        "workers": os.cpu_count() or 1,  # Processes for --batch
+        "search_workers": os.cpu_count() or 1,  # Processes for -a 7 and 8
+        "max_pending": 0,  # Requests --serve runs at once (0: 4 per worker)
+        "external_dir": None,  # Where -a 9 keeps its files (None: temp dir)
+        "external_buffer": 1000000,  # States -a 9 keeps in memory
+        "time_limit": 0,  # Seconds per search (0 is no limit)
+        "node_limit": 0,  # Expanded nodes per search (0 is no limit)
+        "distance": None,  # Exact optimal moves of generated puzzles
+        "min_distance": None,  # Fewest optimal moves of generated puzzles
+        "output": None,  # File for generated puzzles
+        "seed": None,  # Random seed for -r and -g
+        "results": "./reports/results.jsonl",  # Results store
+    }
+
+
 def setup_after_command_line():
     # Setup the settings after the command line has been processed
     SETTINGS["matrix_dim"] = int(SETTINGS["size"] ** 0.5)
@@ -109,12 +315,25 @@ def setup_after_command_line():
     if SETTINGS["Algorithm"] is None:
         SETTINGS["Algorithm"] = best_first_search
 
+    if len(SETTINGS["Heuristics"]) == 0:
+        SETTINGS["Heuristics"] = [SETTINGS["Heuristic"]]
+
+    if len(SETTINGS["Algorithms"]) == 0:
+        SETTINGS["Algorithms"] = [SETTINGS["Algorithm"]]
+
     verbose("Settings:\n")
     verbose(f"Verbose: {SETTINGS['verbose']}\n")
     verbose(f"Random: {SETTINGS['random']}\n")
+    verbose(f"Debug: {SETTINGS['debug']}\n")
     verbose(f"Size: {SETTINGS['size']}\n")
     verbose(f"Heuristic: {SETTINGS['Heuristic'].__name__}\n")
     verbose(f"Algorithm: {SETTINGS['Algorithm'].__name__}\n")
+    verbose(f"TT Size: {SETTINGS['tt_size']}\n")
+    verbose(f"Weight: {SETTINGS['weight']} (-{SETTINGS['weight_step']})\n")
+    verbose(f"Cache: {SETTINGS['cache']} ({SETTINGS['cache_size']} states)\n")
+    verbose(f"Queue: {SETTINGS['queue']} ({SETTINGS['tie_break']})\n")
+    verbose(f"Time Limit: {SETTINGS['time_limit']}\n")
+    verbose(f"Node Limit: {SETTINGS['node_limit']}\n")
     verbose(f"Solve State: {b_replace(SETTINGS['solve_state'])}\n")
     return
 
@@ -126,14 +345,55 @@ def help():
     perror("  -h, --help\t\t\t\tShow this help message")
     perror("  -v, --verbose\t\t\t\tIncrease verbosity (up to 2 times)")
     perror("  -r, --random\t\t\t\tGenerate a random puzzle")
+    perror("  -d, --debug\t\t\t\tCheck incremental heuristics")
+    perror("  --stats\t\t\t\tPrint search metrics and timings")
+    perror("  --time-limit [SEC]\t\t\tStop a search after SEC seconds")
+    perror("  --node-limit [N]\t\t\tStop a search after N expanded nodes")
+    perror("  --batch [PATH]\t\t\tSolve every puzzle in a file or directory")
+    perror("      -a and -H take lists here, e.g. -a 1,2 -H 1,2,3")
+    perror("  --workers [N]\t\t\t\tProcesses for --batch (default all cores)")
+    perror("  --serve\t\t\t\tAnswer JSON line requests on stdin/stdout")
+    perror("  --socket [PATH]\t\t\tServe on a Unix socket instead")
+    perror("  --max-pending [N]\t\t\tRequests --serve takes at once (default 4/worker)")
+    perror("  --search-workers [N]\t\tProcesses for -a 7 and 8 (default all cores)")
+    perror("  -g, --generate [N]\t\t\tWrite N unique solvable puzzles to a file")
+    perror("  --distance [D]\t\t\tOnly generate puzzles D moves from the goal")
+    perror("  --min-distance [D]\t\t\tOnly generate puzzles at least D moves away")
+    perror("  --output [FILE]\t\t\tFile for -g (default solvable/puzzles_N.txt)")
+    perror("  --seed [N]\t\t\t\tRandom seed for -r and -g")
+    perror("  --results [FILE]\t\t\tResults store (default reports/results.jsonl)")
     perror("  -s, --size [N]\t\t\tSet the size of the puzzle (default 9)")
-    perror("  -H, --heuristic [1,2,3]\t\tChoose the heuristic function")
+    perror("  -H, --heuristic [1-7]\t\tChoose the heuristic function")
     perror("      1: Misplaced Tiles (default)")
     perror("      2: Manhattan Distance")
     perror("      3: TBD")
-    perror("  -a, --algorithm [1,2]\t\tChoose the algorithm")
+    perror("      4: Pattern Database (needs --build-pdb first)")
+    perror("      5: Linear Conflict")
+    perror("      6: Walking Distance (up to 4x4)")
+    perror("      7: Perfect Distance Table (3x3 only)")
+    perror("  -a, --algorithm [1-10]\t\t\tChoose the algorithm")
     perror("      1: Best-First Search (default)")
     perror("      2: A* algorithm")
+    perror("      3: IDA* algorithm")
+    perror("      4: Perfect Distance Table lookup (3x3 only)")
+    perror("      5: Bidirectional A* (MM)")
+    perror("      6: Anytime A* (ARA*), use with --time-limit or --node-limit")
+    perror("      7: Parallel A* (HDA*), see --search-workers")
+    perror("      8: Parallel IDA* (root split), see --search-workers")
+    perror("      9: External memory A*, keeps its nodes on disk")
+    perror("      10: Breadth-first iterative deepening A*, keeps a few layers")
+    perror("  --external-dir [PATH]\t\t\tWhere -a 9 keeps its files (default temp dir)")
+    perror("  --external-buffer [N]\t\tStates -a 9 keeps in memory (default 1000000)")
+    perror("  --tt-size [N]\t\t\t\tIDA* transposition table size (0 off)")
+    perror("  --cache\t\t\t\tReuse optimal solutions saved in ./cache")
+    perror("  --cache-size [N]\t\t\tStates the cache keeps in memory")
+    perror("  --weight [W]\t\t\t\tFirst ARA* heuristic weight (default 3)")
+    perror("  --weight-step [D]\t\t\tARA* weight drop per pass (default 0.5)")
+    perror("  --queue [heap,bucket]\t\t\tFrontier priority queue (default heap)")
+    perror("  --tie-break [h,lifo,fifo]\t\tOrder of equal f nodes (default h)")
+    perror("  --expand-batch [K]\t\t\tExpand K nodes at once in -a 1 and 2 (default 1)")
+    perror("  --build-pdb\t\t\t\tBuild the pattern database for -s N")
+    perror("  --pdb-patterns [1,2,3/4,5,6]\t\tTile groups for --build-pdb")
     perror("Example: slidingtiles.py -v -v -r -H 2")
     perror("Verbose:2, Random puzzle, Manhattan Distance, Best-First Search")
     perror("Supports < some_puzzle.txt for input")
@@ -163,15 +423,155 @@ def get_solution(puzzle):
     # Grab the algorithm from the settings and run it
     # For the args, we pass the puzzle, the solved state, and the heuristic
     # These are all generated from process_command_line
-    return SETTINGS["Algorithm"](puzzle, SETTINGS["solve_state"], SETTINGS["Heuristic"])
+    # The puzzle is packed into an integer key before the search starts
+    # With --cache, a known optimal solution is used instead of searching,
+    # and new optimal solutions are saved for next time
+    start_key = pack_state(puzzle)
+    cache = get_cache()
+    if cache is not None:
+        solution = cache.get(start_key)
+        if solution is not None:
+            stats = new_stats()
+            stats.stop("cached")
+            return solution
+
+    solution = SETTINGS["Algorithm"](start_key, SETTINGS["solve_key"], SETTINGS["Heuristic"])
+    if cache is not None and solution is not None and proven_optimal():
+        cache.put(solution)
+    return solution
+
+
+def proven_optimal():
+    # True if the last search's solution is known to be the shortest
+    # Best First Search and the inadmissible pnld heuristic give no guarantee
+    algorithm = SETTINGS["Algorithm"]
+    stats = SETTINGS["search_stats"]
+    if algorithm is perfect_search:
+        return True
+    if SETTINGS["Heuristic"] is h3_pnld:
+        return False
+    if algorithm is ara_star:
+        return stats.bound == 1.0
+    optimal = (
+        a_star,
+        ida_star,
+        bidirectional_mm,
+        hda_star,
+        parallel_ida_star,
+        external_a_star,
+        bfida_star,
+    )
+    return stats.status == "solved" and algorithm in optimal
+
+
+def check_combination(size, algorithm, heuristic):
+    # Raise ValueError if algorithm and heuristic can't solve boards of
+    # size, or FileNotFoundError if they need a table that was not built
+    # Tables that are built on first use only need the size to fit
+    if size != 9 and (algorithm is perfect_search or heuristic is h7_perfect):
+        raise ValueError("The perfect distance table is only supported for 3x3")
+    if size > 16 and heuristic is h6_walking_distance:
+        raise ValueError("Walking distance is only supported up to 4x4")
+    if heuristic is h4_pdb and not os.path.exists(pdb_filename(size)):
+        raise pdb_missing(size)
+    return
+
+
+class Solver:
+    # Solve puzzles from other Python code, without the command line
+    # A Solver has its own settings (see default_settings): board size,
+    # algorithm, heuristic, limits and the lookup tables built for them.
+    # The tables are built on the first solve that needs them and kept for
+    # the next ones, so Solvers of different sizes can be used side by side:
+    #   solver = Solver(9, "a_star", "h2_manhattan", node_limit=100000)
+    #   solution = solver.solve("1 2 3 b 4 5 6 7 8")
+    # algorithm and heuristic are names or numbers like -a and -H, and the
+    # other options are the settings of the same name. Bad arguments raise
+    # ValueError, and FileNotFoundError means -H 4 needs --build-pdb first
+    # (see check_combination). A Solver is not thread safe, since the search code reads
+    # its settings from SETTINGS while it runs (see active).
+    def __init__(self, size=9, algorithm="a_star", heuristic="h2_manhattan", **options):
+        self.settings = default_settings()
+        for key, value in options.items():
+            if key not in self.settings or key in ("size", "Algorithm", "Heuristic"):
+                raise ValueError(f"Invalid option: {key}")
+            self.settings[key] = value
+        dim = int(size ** 0.5)
+        if size < 4 or dim * dim != size:
+            raise ValueError(f"Invalid size: {size}")
+        self.settings["size"] = size
+        self.settings["matrix_dim"] = dim
+        self.settings["Algorithm"] = self.choose(algorithm, ALGORITHMS, "algorithm")
+        self.settings["Heuristic"] = self.choose(heuristic, HEURISTICS, "heuristic")
+        check_combination(size, self.settings["Algorithm"], self.settings["Heuristic"])
+        self.stats = None  # SearchStats of the last solve
+        with self.active():
+            set_solve_state()
+        return
+
+    def choose(self, value, choices, kind):
+        # Pick an algorithm or heuristic by number or name
+        for number, choice in enumerate(choices, 1):
+            if value == number or value == choice.__name__ or value is choice:
+                return choice
+        raise ValueError(f"Invalid {kind}: {value}")
+
+    @contextlib.contextmanager
+    def active(self):
+        # Make this Solver's settings the ones the search code reads
+        global SETTINGS
+        previous = SETTINGS
+        SETTINGS = self.settings
+        try:
+            yield
+        finally:
+            SETTINGS = previous
+
+    def solve(self, puzzle):
+        # Solve one puzzle, a list of tiles (0 is the blank) or a line like
+        # the input ("1 2 3 b 4 5 6 7 8")
+        # Returns every board from the puzzle to the goal, each a list of
+        # tiles, or None if no solution was found within the limits
+        if isinstance(puzzle, str):
+            puzzle = puzzle.replace("b", "0").split()
+        try:
+            puzzle = [int(tile) for tile in puzzle]
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid puzzle: {puzzle}")
+        if sorted(puzzle) != list(range(self.settings["size"])):
+            raise ValueError(f"Invalid puzzle for size {self.settings['size']}: {puzzle}")
+        with self.active():
+            if not solvable(puzzle):
+                raise ValueError(f"Puzzle is not solvable: {puzzle}")
+            solution = get_solution(puzzle)
+            self.stats = SETTINGS["search_stats"]
+            if solution is None:
+                return None
+            return [unpack_state(state) for state in solution]
+
+    def solve_many(self, puzzles):
+        # Solve every puzzle in an iterable, yielding each solution (or None)
+        # in order as soon as it is found
+        for puzzle in puzzles:
+            yield self.solve(puzzle)
 
 
-def show_solution(solution):
+def show_solution(puzzle, moves):
     # Show the solution to the user and final step count if verbose is on
+    # The boards are made from the moves one at a time as they are printed
     if SETTINGS["verbose"] > 1:
-        for step in solution:
+        for step in replay_moves(pack_state(puzzle), moves):
             print(f"{b_replace(step)}")
-        print(f"Total Steps: {len(solution)}")
+        print(f"Total Steps: {solution_steps(moves)}")
+    return
+
+
+def show_stats():
+    # Show the metrics of the last search if stats is on
+    stats = SETTINGS.get("search_stats")
+    if SETTINGS["stats"] and stats is not None:
+        for line in stats.summary():
+            perror(f"{line}\n")
     return
 
 
@@ -194,19 +594,33 @@ def set_puzzle():
 
 
 def random_puzzle(size):
-    # Generate a random puzzle
-    # Check if the puzzle is solvable
-    # If not, keep generating random puzzles until one is solvable
-    puzzle = np.random.permutation(size)
-    verbose(f"Random puzzle: {b_replace(puzzle)}\n")
+    # Generate a random solvable puzzle
+    import numpy as np
 
-    while solvable(puzzle) is False:
-        verbose("Unsolvable Reshuffling puzzle\n")
-        puzzle = np.random.permutation(size)
-        verbose(f"Random puzzle: {b_replace(puzzle)}\n")
+    rng = np.random.default_rng(SETTINGS["seed"])
+    puzzle = random_puzzles(1, size, rng)[0]
+    verbose(f"Random puzzle: {b_replace(puzzle)}\n")
     return puzzle
 
 
+def random_puzzles(count, size, rng):
+    # Generate count random solvable puzzles as a (count, size) array
+    # Swapping two tiles flips the inversion parity, so every unsolvable
+    # draw is turned into a solvable one instead of drawing again. The swap
+    # pairs the two halves one to one, so the result is still uniform.
+    import numpy as np
+
+    puzzles = rng.permuted(np.tile(np.arange(size), (count, 1)), axis=1)
+    rows = np.flatnonzero(~solvable_mask(puzzles))
+    # Swap the first two squares that do not hold the blank
+    first = np.where(puzzles[rows, 0] == 0, 1, 0)
+    second = np.where((puzzles[rows, 0] == 0) | (puzzles[rows, 1] == 0), 2, 1)
+    tiles = puzzles[rows, first]
+    puzzles[rows, first] = puzzles[rows, second]
+    puzzles[rows, second] = tiles
+    return puzzles
+
+
 def user_puzzle():
     # Get the puzzle from the user
     # Check if the puzzle is a square number
@@ -216,62 +630,116 @@ def user_puzzle():
 
     user_input = input("Enter the puzzle: ")
 
+    puzzle = parse_puzzle(user_input)
+    if puzzle is None:
+        exit(1)
+
+    # Update global settings
+    set_size(len(puzzle))
+    verbose(f"\nUser puzzle: {b_replace(puzzle)}\n")
+    verbose(f"Size: {SETTINGS['size']}\n")
+    verbose(f"Matrix Dim: {SETTINGS['matrix_dim']}\n")
+    verbose(f"Solve State: {b_replace(SETTINGS['solve_state'])}\n")
+    return puzzle
+
+
+def parse_puzzle(text):
+    # Turn a line like "1 2 3 b 4 5 6 7 8" into a puzzle
+    # Returns None (after printing why) if it is not a valid puzzle
+
     # If one input is b convert it to 0
-    user_input = user_input.replace("b", "0")
+    text = text.replace("b", "0")
 
     # Split the input by spaces into a python list
-    puzzle = np.array([int(x) for x in user_input.split()])
+    try:
+        puzzle = [int(x) for x in text.split()]
+    except ValueError:
+        perror("Invalid puzzle: Only numbers and b are allowed")
+        return None
 
     # Check if the input is a square number
-    if int(len(puzzle) ** 0.5) ** 2 != len(puzzle):
+    if len(puzzle) == 0 or int(len(puzzle) ** 0.5) ** 2 != len(puzzle):
         perror("Invalid puzzle: Puzzle is not a square")
-        exit(1)
+        return None
 
     # Check if the input is a permutation of the numbers 0 to n
     if sorted(puzzle) != list(range(len(puzzle))):
         perror("Invalid puzzle: Not a permutation of b, 1 to n")
-        exit(1)
+        return None
 
-    # Update global settings
-    SETTINGS["size"] = len(puzzle)
-    SETTINGS["matrix_dim"] = int(len(puzzle) ** 0.5)
-    SETTINGS["solve_state"] = solved_state()
-    verbose(f"\nUser puzzle: {b_replace(puzzle)}\n")
-    verbose(f"Size: {SETTINGS['size']}\n")
-    verbose(f"Matrix Dim: {SETTINGS['matrix_dim']}\n")
-    verbose(f"Solve State: {b_replace(SETTINGS['solve_state'])}\n")
     return puzzle
 
 
-def solvable(puzzle):
-    # Check if the puzzle is solvable
-    # If the number of inversions is even, the puzzle is solvable
-    # If the number of inversions is odd, the puzzle is not solvable
+def set_size(size):
+    # Switch the board size (and everything derived from it)
+    SETTINGS["size"] = size
+    SETTINGS["matrix_dim"] = int(size ** 0.5)
+    set_solve_state()
+    return
 
-    verbose("Start Solvable\n", 2)
+
+def solvable(puzzle):
+    # Check if the puzzle is solvable, by the rule in solvable_mask
+    # One puzzle is counted in plain Python, so solving needs no numpy
+    size = len(puzzle)
+    dim = int(size ** 0.5)
+    tiles = [int(tile) for tile in puzzle if tile != 0]
     inversions = 0
-    for i in range(len(puzzle)):
-        if puzzle[i] == 0:
-            continue
-        for j in range(i + 1, len(puzzle)):
-            if puzzle[j] == 0:
-                continue
-            if puzzle[i] > puzzle[j]:
+    for i in range(len(tiles)):
+        for j in range(i + 1, len(tiles)):
+            if tiles[i] > tiles[j]:
                 inversions += 1
-                verbose(f"({puzzle[i]},{puzzle[j]}) ", 2)
-
-    can_solve = inversions % 2 == 0
-    verbose(f"\nInversions: {inversions}\n", 2)
-    verbose(f"Solvable: {can_solve}\n", 2)
-    verbose("End Solvable\n", 2)
+    if dim % 2 == 1:
+        can_solve = inversions % 2 == 0
+    else:
+        blank_row = list(puzzle).index(0) // dim
+        can_solve = (inversions + blank_row) % 2 == (dim - 1) % 2
+    if SETTINGS["verbose"] > 1:
+        verbose("Start Solvable\n", 2)
+        verbose(f"Inversions: {inversions}\n", 2)
+        verbose(f"Solvable: {can_solve}\n", 2)
+        verbose("End Solvable\n", 2)
     return can_solve
 
 
-def h1_misplaced(puzzle):
+def count_inversions(puzzles):
+    # Number of tile pairs in the wrong order for each row of puzzles
+    # The blank is left out. One numpy pass per square.
+    import numpy as np
+
+    count, size = puzzles.shape
+    tiles = puzzles[puzzles != 0].reshape(count, size - 1)
+    inversions = np.zeros(count, dtype=np.int64)
+    for i in range(size - 2):
+        inversions += (tiles[:, i : i + 1] > tiles[:, i + 1 :]).sum(axis=1)
+    return inversions
+
+
+def solvable_mask(puzzles):
+    # Which rows of puzzles (a (count, size) array) are solvable
+    # Odd width: a move changes the inversions by 0 or by width - 1 (even),
+    # so the puzzle is solvable if the inversions are even like the goal.
+    # Even width: a vertical move changes them by an odd number and also
+    # moves the blank a row, so inversions + blank row keeps its parity.
+    # The goal has 0 inversions and the blank on the last row.
+    import numpy as np
+
+    count, size = puzzles.shape
+    dim = int(size ** 0.5)
+    inversions = count_inversions(puzzles)
+    if dim % 2 == 1:
+        return inversions % 2 == 0
+    blank_row = np.argmax(puzzles == 0, axis=1) // dim
+    return (inversions + blank_row) % 2 == (dim - 1) % 2
+
+
+def h1_misplaced(state):
     # Misplaced Tiles Heuristic
     # This will count the number of tiles that are not in the correct position
     # The blank tile is not counted
 
+    trace = SETTINGS["verbose"]
+    puzzle = unpack_state(state)
     misplaced = 0
     for i in range(len(puzzle)):
         # Don't count the blank tile
@@ -282,12 +750,14 @@ def h1_misplaced(puzzle):
         # Add 1 to i to get the correct value of the tile
         if puzzle[i] != i + 1:
             misplaced += 1
-            verbose(f"{puzzle[i]} ", 2)
-    verbose(f"Misplaced tiles: {misplaced}\n")
+            if trace > 1:
+                verbose(f"{puzzle[i]} ", 2)
+    if trace:
+        verbose(f"Misplaced tiles: {misplaced}\n")
     return misplaced
 
 
-def h2_manhattan(puzzle):
+def h2_manhattan(state):
     # Manhattan Distance Heuristic
     # This will calculate the distance of each tile from its correct position
     # The blank tile is not counted
@@ -295,9 +765,12 @@ def h2_manhattan(puzzle):
     # Find the row and column of the preferred position of the tile
     # Find the distance between the two positions
 
+    trace = SETTINGS["verbose"]
+    puzzle = unpack_state(state)
     distance = 0
     matrix_dim = int(len(puzzle) ** 0.5)
-    verbose("(COL,ROW) -> (COL,ROW)\n", 2)
+    if trace > 1:
+        verbose("(COL,ROW) -> (COL,ROW)\n", 2)
     for i in range(len(puzzle)):
         if puzzle[i] == 0:
             continue
@@ -309,34 +782,431 @@ def h2_manhattan(puzzle):
         pref_col = (cur_num - 1) % matrix_dim
         cur_distance = abs(cur_row - pref_row) + abs(cur_col - pref_col)
         distance += cur_distance
-        verbose(f"{cur_num}@({cur_col + 1},{cur_row + 1})", 2)
-        verbose(f"->({pref_col + 1},{pref_row + 1})", 2)
-        verbose(f" Distance: {cur_distance}\n", 2)
+        if trace > 1:
+            verbose(f"{cur_num}@({cur_col + 1},{cur_row + 1})", 2)
+            verbose(f"->({pref_col + 1},{pref_row + 1})", 2)
+            verbose(f" Distance: {cur_distance}\n", 2)
 
-    verbose(f"Manhattan Distance: {distance}\n")
+    if trace:
+        verbose(f"Manhattan Distance: {distance}\n")
     return distance
 
 
-def h3_pnld(puzzle):
+def h3_pnld(state):
     # My Heuristic "Porque No Los Dos" PNLD
     # Combines Misplaced Tiles and Manhattan Distance
     # Return if either heuristic is 0
     # Otherwise, return the sum of the two heuristics
 
-    misplaced = h1_misplaced(puzzle)
-    manhattan = h2_manhattan(puzzle)
+    misplaced = h1_misplaced(state)
+    manhattan = h2_manhattan(state)
     if manhattan == 0 or misplaced == 0:
         return 0
     pnld = misplaced + manhattan
-    verbose(f"PNLD: {pnld}\n")
+    if SETTINGS["verbose"]:
+        verbose(f"PNLD: {pnld}\n")
     return pnld
 
 
+def h1_misplaced_delta(state, tile, src, dst):
+    # Change in misplaced tiles when tile slides from src to dst
+    # Only the moved tile can change from placed to misplaced
+    table = SETTINGS["misplaced_table"]
+    offset = tile * SETTINGS["size"]
+    return table[offset + dst] - table[offset + src]
+
+
+def h2_manhattan_delta(state, tile, src, dst):
+    # Change in manhattan distance when tile slides from src to dst
+    table = SETTINGS["manhattan_table"]
+    offset = tile * SETTINGS["size"]
+    return table[offset + dst] - table[offset + src]
+
+
+def h3_pnld_delta(state, tile, src, dst):
+    # PNLD is the sum of the two, so the deltas add up as well
+    table = SETTINGS["pnld_table"]
+    offset = tile * SETTINGS["size"]
+    return table[offset + dst] - table[offset + src]
+
+
+def h4_pdb(state):
+    # Additive Pattern Database Heuristic
+    # The tiles are split into disjoint groups. For each group the database
+    # holds the number of moves of those tiles needed to put them in place.
+    # Since no move is counted twice the values can be added up.
+
+    trace = SETTINGS["verbose"]
+    pdb = get_pdb()
+    positions = tile_positions(state)
+    distance = 0
+    for tiles, offset in pdb["patterns"]:
+        value = pdb["map"][offset + pattern_rank(positions, tiles)]
+        if trace > 1:
+            verbose(f"Pattern {tiles}: {value}\n", 2)
+        distance += value
+    if trace:
+        verbose(f"Pattern Database: {distance}\n")
+    return distance
+
+
+def h4_pdb_delta(state, tile, src, dst):
+    # Only the group holding the moved tile changes value
+    # Look it up for the child and for the parent (tile back at src)
+    pdb = get_pdb()
+    group = pdb["tile_pattern"].get(tile)
+    if group is None:
+        return 0
+    tiles, offset = pdb["patterns"][group]
+    positions = tile_positions(state)
+    after = pdb["map"][offset + pattern_rank(positions, tiles)]
+    positions[tile] = src
+    before = pdb["map"][offset + pattern_rank(positions, tiles)]
+    return after - before
+
+
+def h5_linear_conflict(state):
+    # Linear Conflict Heuristic
+    # Manhattan distance, plus 2 moves for every tile that has to step out
+    # of its goal row (or column) to let another tile of that row pass it.
+    # Conflicts are looked up by the packed contents of each row and column.
+
+    tables = get_lc_tables()
+    conflicts = 0
+    for line in range(tables["dim"]):
+        conflicts += tables["rows"][line][row_contents(state, line)]
+        conflicts += tables["cols"][line][col_contents(state, line)]
+    distance = h2_manhattan(state) + 2 * conflicts
+    if SETTINGS["verbose"]:
+        verbose(f"Linear Conflicts: {conflicts}\n")
+        verbose(f"Linear Conflict Distance: {distance}\n")
+    return distance
+
+
+def h6_walking_distance(state):
+    # Walking Distance Heuristic
+    # Only looks at how many tiles of each goal row are in each row, and
+    # which row the blank is in. The table holds the exact number of moves
+    # needed to sort those counts. The same is done for columns and added.
+
+    table = get_wd_table()
+    vertical = table["dist"][wd_key(state, True)]
+    horizontal = table["dist"][wd_key(state, False)]
+    if SETTINGS["verbose"]:
+        verbose(f"Walking Distance: {vertical} + {horizontal}\n")
+    return vertical + horizontal
+
+
+def h7_perfect(state):
+    # Perfect Distance Heuristic
+    # The exact number of moves to the goal, read from a table of every
+    # reachable state. Only the 3x3 board is small enough for this.
+    # Used as the ground truth to compare the other heuristics against.
+
+    distance = get_perfect()["map"][permutation_rank(state)]
+    if SETTINGS["verbose"]:
+        verbose(f"Perfect Distance: {distance}\n")
+    return distance
+
+
+def h5_linear_conflict_delta(state, tile, src, dst):
+    # Manhattan changes by the moved tile only.
+    # A tile sliding along its row keeps the order of that row, so only the
+    # two columns it left and entered can change their conflicts (and the
+    # two rows for a vertical slide).
+    tables = get_lc_tables()
+    dim = tables["dim"]
+    delta = h2_manhattan_delta(state, tile, src, dst)
+    parent = slide(state, src, dst)
+    if src // dim == dst // dim:
+        lines, contents = tables["cols"], col_contents
+        changed = (src % dim, dst % dim)
+    else:
+        lines, contents = tables["rows"], row_contents
+        changed = (src // dim, dst // dim)
+    for line in changed:
+        table = lines[line]
+        delta += 2 * (table[contents(state, line)] - table[contents(parent, line)])
+    return delta
+
+
+def h6_walking_distance_delta(state, tile, src, dst):
+    # A vertical slide only changes the row counts, a horizontal slide only
+    # the column counts. The parent's key is the child's key with the tile
+    # moved back and the blank in the line the tile came into.
+    table = get_wd_table()
+    dim = table["dim"]
+    vertical = src // dim != dst // dim
+    if vertical:
+        src_line, dst_line = src // dim, dst // dim
+        goal_line = (tile - 1) // dim
+    else:
+        src_line, dst_line = src % dim, dst % dim
+        goal_line = (tile - 1) % dim
+    key = wd_key(state, vertical)
+    blank_shift = 3 * dim * dim
+    parent = key - (1 << (3 * (dst_line * dim + goal_line)))
+    parent += 1 << (3 * (src_line * dim + goal_line))
+    parent += (dst_line - src_line) << blank_shift
+    return table["dist"][key] - table["dist"][parent]
+
+
+# Heuristics that can be updated from the parent's value after a move
+# The delta functions take (child_state, tile, src, dst)
+HEURISTIC_DELTAS = {
+    h1_misplaced: h1_misplaced_delta,
+    h2_manhattan: h2_manhattan_delta,
+    h3_pnld: h3_pnld_delta,
+    h4_pdb: h4_pdb_delta,
+    h5_linear_conflict: h5_linear_conflict_delta,
+    h6_walking_distance: h6_walking_distance_delta,
+}
+
+
+def build_heuristic_tables():
+    # Precompute the per tile, per position cost used by the deltas
+    # The tables are flat lists indexed by tile * size + position
+    size = SETTINGS["size"]
+    goals = [size - 1] + [tile - 1 for tile in range(1, size)]
+    misplaced, manhattan = heuristic_tables(goals)
+    SETTINGS["misplaced_table"] = misplaced
+    SETTINGS["manhattan_table"] = manhattan
+    SETTINGS["pnld_table"] = [a + b for a, b in zip(misplaced, manhattan)]
+    return
+
+
+def heuristic_tables(goals):
+    # Misplaced and manhattan cost of every tile on every square
+    # goals[tile] is the square the tile should end up on
+    size = SETTINGS["size"]
+    dim = int(size ** 0.5)
+    misplaced = [0] * (size * size)
+    manhattan = [0] * (size * size)
+    for tile in range(1, size):
+        goal = goals[tile]
+        for pos in range(size):
+            misplaced[tile * size + pos] = int(pos != goal)
+            manhattan[tile * size + pos] = abs(pos // dim - goal // dim) + abs(
+                pos % dim - goal % dim
+            )
+    return misplaced, manhattan
+
+
+def target_heuristic(h_func, target):
+    # Heuristic toward any target state instead of the goal, and its delta
+    # Used by the backward side of the bidirectional search.
+    # Misplaced, manhattan and pnld work for any target from their tables,
+    # the other heuristics are built around the goal and use manhattan.
+    size = SETTINGS["size"]
+    bits = SETTINGS["tile_bits"]
+    mask = SETTINGS["tile_mask"]
+    misplaced, manhattan = heuristic_tables(tile_positions(target))
+    if h_func is h1_misplaced:
+        table = misplaced
+    elif h_func is h3_pnld:
+        table = [a + b for a, b in zip(misplaced, manhattan)]
+    else:
+        table = manhattan
+
+    def heuristic(state):
+        distance = 0
+        for i in range(size):
+            tile = (state >> (i * bits)) & mask
+            if tile != 0:
+                distance += table[tile * size + i]
+        return distance
+
+    def delta(state, tile, src, dst):
+        return table[tile * size + dst] - table[tile * size + src]
+
+    return heuristic, delta
+
+
+def row_contents(state, row):
+    # Packed tiles of one row, the row's fields taken straight from the key
+    dim = int(SETTINGS["size"] ** 0.5)
+    bits = SETTINGS["tile_bits"]
+    return (state >> (row * dim * bits)) & ((1 << (dim * bits)) - 1)
+
+
+def col_contents(state, col):
+    # Packed tiles of one column, top to bottom, in the same layout as a row
+    dim = int(SETTINGS["size"] ** 0.5)
+    bits = SETTINGS["tile_bits"]
+    mask = SETTINGS["tile_mask"]
+    contents = 0
+    for row in range(dim):
+        contents |= ((state >> ((row * dim + col) * bits)) & mask) << (row * bits)
+    return contents
+
+
+def line_conflicts(contents, line, is_row):
+    # Number of tiles that must leave this row (or column) so the rest of
+    # the tiles that belong in it are in goal order. This is the length of
+    # the line's goal tiles minus their longest increasing run.
+    dim = int(SETTINGS["size"] ** 0.5)
+    bits = SETTINGS["tile_bits"]
+    mask = SETTINGS["tile_mask"]
+    order = []
+    for i in range(dim):
+        tile = (contents >> (i * bits)) & mask
+        if tile == 0:
+            continue
+        goal_row, goal_col = divmod(tile - 1, dim)
+        if is_row and goal_row == line:
+            order.append(goal_col)
+        elif not is_row and goal_col == line:
+            order.append(goal_row)
+
+    longest = [1] * len(order)
+    for i in range(len(order)):
+        for j in range(i):
+            if order[j] < order[i] and longest[j] + 1 > longest[i]:
+                longest[i] = longest[j] + 1
+    return len(order) - max(longest, default=0)
+
+
+class LineConflictTable(dict):
+    # Conflict table for boards whose lines are too wide to precompute
+    # Entries are filled in the first time a row or column is seen
+    def __init__(self, line, is_row):
+        self.line = line
+        self.is_row = is_row
+        return
+
+    def __missing__(self, contents):
+        value = line_conflicts(contents, self.line, self.is_row)
+        self[contents] = value
+        return value
+
+
+def build_lc_tables():
+    # Precompute the conflicts of every packed row and column content
+    # Up to 16 bits per line (4x4) every value is in a bytearray,
+    # bigger boards fall back to tables filled on demand
+    dim = int(SETTINGS["size"] ** 0.5)
+    line_bits = dim * SETTINGS["tile_bits"]
+    tables = {"size": SETTINGS["size"], "dim": dim, "rows": [], "cols": []}
+    for is_row, name in ((True, "rows"), (False, "cols")):
+        for line in range(dim):
+            if line_bits > 16:
+                tables[name].append(LineConflictTable(line, is_row))
+                continue
+            table = bytearray(1 << line_bits)
+            for contents in range(1 << line_bits):
+                table[contents] = line_conflicts(contents, line, is_row)
+            tables[name].append(table)
+    return tables
+
+
+def get_lc_tables():
+    # Build the linear conflict tables for the current size on first use
+    tables = SETTINGS.get("lc_tables")
+    if tables is None or tables["size"] != SETTINGS["size"]:
+        tables = build_lc_tables()
+        SETTINGS["lc_tables"] = tables
+    return tables
+
+
+def wd_key(state, vertical):
+    # Walking distance key: count of tiles per (row, goal row) in 3 bit
+    # fields, and the blank's row in the top field.
+    # With vertical False the same is done for columns.
+    dim = int(SETTINGS["size"] ** 0.5)
+    bits = SETTINGS["tile_bits"]
+    mask = SETTINGS["tile_mask"]
+    key = 0
+    for i in range(SETTINGS["size"]):
+        tile = (state >> (i * bits)) & mask
+        if vertical:
+            line = i // dim
+            goal_line = (tile - 1) // dim
+        else:
+            line = i % dim
+            goal_line = (tile - 1) % dim
+        if tile == 0:
+            key |= line << (3 * dim * dim)
+        else:
+            key += 1 << (3 * (line * dim + goal_line))
+    return key
+
+
+def build_wd_table(dim):
+    # Breadth first search over the walking distance keys from the goal
+    # A move takes a tile of any goal row from the row next to the blank
+    # into the blank's row, and the blank moves over.
+    blank_shift = 3 * dim * dim
+    goal = (dim - 1) << blank_shift
+    for line in range(dim):
+        count = dim - 1 if line == dim - 1 else dim
+        goal += count << (3 * (line * dim + line))
+
+    dist = {goal: 0}
+    frontier = [goal]
+    depth = 0
+    while len(frontier) > 0:
+        depth += 1
+        next_frontier = []
+        for key in frontier:
+            blank = key >> blank_shift
+            for line in (blank - 1, blank + 1):
+                if line < 0 or line >= dim:
+                    continue
+                for goal_line in range(dim):
+                    if (key >> (3 * (line * dim + goal_line))) & 7 == 0:
+                        continue
+                    child = key - (1 << (3 * (line * dim + goal_line)))
+                    child += 1 << (3 * (blank * dim + goal_line))
+                    child += (line - blank) << blank_shift
+                    if child not in dist:
+                        dist[child] = depth
+                        next_frontier.append(child)
+        frontier = next_frontier
+    return dist
+
+
+def get_wd_table():
+    # Build the walking distance table for the current size on first use
+    table = SETTINGS.get("wd_table")
+    if table is not None and table["size"] == SETTINGS["size"]:
+        return table
+
+    dim = int(SETTINGS["size"] ** 0.5)
+    if dim > 4:
+        raise ValueError("Walking distance is only supported up to 4x4")
+    table = {"size": SETTINGS["size"], "dim": dim, "dist": build_wd_table(dim)}
+    SETTINGS["wd_table"] = table
+    return table
+
+
+def child_heuristic(h_func, delta, parent_h, move):
+    # Heuristic value of a child generated by successors
+    # Uses the O(1) delta when the heuristic has one, otherwise recomputes
+    # With debug on, the delta is checked against a full recomputation
+    state, tile, src, dst, code = move
+    if delta is None:
+        return h_func(state)
+
+    h = parent_h + delta(state, tile, src, dst)
+    if SETTINGS["debug"]:
+        full = h_func(state)
+        if full != h:
+            raise ValueError(
+                f"Heuristic mismatch: {h_func.__name__} delta {h} != {full}\n"
+                f"State: {b_replace(state)} tile {tile} {src}->{dst}"
+            )
+    return h
+
+
 def b_replace(puzzle, as_matrix=False):
     # This will replace the 0 with a b
     # If as_matrix is True, the puzzle will be printed as a matrix
     # This helps with trouble shooting and debugging to make sure the
     # moves are happening properly
+    # Packed states are unpacked first so they print like any other puzzle
+    if isinstance(puzzle, int):
+        puzzle = unpack_state(puzzle)
+
     if as_matrix:
         dim = SETTINGS["matrix_dim"]
         string = ""
@@ -359,250 +1229,3403 @@ def b_replace(puzzle, as_matrix=False):
     return string
 
 
-def legal_moves(puzzle):
+def legal_moves(state):
     # This returns all legal moves. *It does not account for any heuristics.*
     # It simply returns all the possible moves that can be made from this
     # Position
-    # The moves are returned as a list of puzzles
+    # The moves are returned as a list of (state, tile, src, dst, code)
+    # tuples, see successors. The searches call successors directly, with
+    # the blank and last move kept on their nodes.
     # The moves are returned in the order of up, down, left, right
+    i = find_blank(state)
+    moves = list(successors(state, i))
+
+    # The trace is only built when it will be shown
+    if SETTINGS["verbose"] > 1:
+        trace_legal_moves(state, i, moves)
+    return moves
+
+
+def successors(state, blank, last=-1):
+    # Yield the moves from state one at a time, in the order of MOVES
+    # blank is the blank's position and last the code of the move that
+    # made state (-1 for none). The move that undoes last is skipped, since
+    # it only leads back to the parent.
+    # Each move is (state, tile, src, dst, code): state is the packed
+    # child, tile slid from src to dst and code is the blank's direction.
+    # The blank's neighbors come from the table built by build_move_tables,
+    # so there is no scan for the blank and no row/column math.
+    mask = SETTINGS["tile_mask"]
+    blank_shift = blank * SETTINGS["tile_bits"]
+    skip = last ^ 1 if last >= 0 else -1
+    for target, code, shift in SETTINGS["neighbors"][blank]:
+        if code == skip:
+            continue
+        tile = (state >> shift) & mask
+        child = state ^ (tile << shift) ^ (tile << blank_shift)
+        yield (child, tile, target, blank, code)
+
+
+def successor_list(state, blank, last=-1):
+    # successors as a list, so --stats can time the whole move generation
+    return list(successors(state, blank, last))
+
+
+def build_move_tables(dim):
+    # For every blank position, the (target, code, shift) of each neighbor
+    # the blank can swap with: target is the neighbor's position, code its
+    # direction (see MOVES) and shift its bit offset in a packed state
+    bits = tile_bits(dim * dim)
+    tables = []
+    for blank in range(dim * dim):
+        row = blank // dim
+        col = blank % dim
+        neighbors = []
+        if row > 0:
+            neighbors.append((blank - dim, 0))
+        if row < dim - 1:
+            neighbors.append((blank + dim, 1))
+        if col > 0:
+            neighbors.append((blank - 1, 2))
+        if col < dim - 1:
+            neighbors.append((blank + 1, 3))
+        tables.append(
+            tuple((target, code, target * bits) for target, code in neighbors)
+        )
+    return tables
+
+
+def trace_legal_moves(state, blank, moves):
+    # Print the moves found by legal_moves (verbose level 2)
     dim = SETTINGS["matrix_dim"]
-    moves = []
-    # Find all the combinations of the puzzle for a single move
+    row = blank // dim
+    col = blank % dim
     verbose("Start Legal Moves\n", 2)
     verbose("Legal Moves: \n", 2)
-    for i in range(len(puzzle)):
-        if puzzle[i] == 0:
-            row = i // dim
-            col = i % dim
-            verbose(f"Blank tile: ({col + 1},{row + 1})\n", 2)
-
-            if row > 0:
-                verbose(f"Move up: ({col + 1},{row})\n", 2)
-                move = puzzle.copy()
-                move[i] = move[i - dim]
-                move[i - dim] = 0
-                moves.append(move)
-            if row < dim - 1:
-                verbose(f"Move down: ({col + 1},{row + 2})\n", 2)
-                move = puzzle.copy()
-                move[i] = move[i + dim]
-                move[i + dim] = 0
-                moves.append(move)
-            if col > 0:
-                verbose(f"Move left: ({col},{row + 1})\n", 2)
-                move = puzzle.copy()
-                move[i] = move[i - 1]
-                move[i - 1] = 0
-                moves.append(move)
-            if col < dim - 1:
-                verbose(f"Move right: ({col + 2},{row + 1})\n", 2)
-                move = puzzle.copy()
-                move[i] = move[i + 1]
-                move[i + 1] = 0
-                moves.append(move)
-
+    verbose(f"Blank tile: ({col + 1},{row + 1})\n", 2)
+    for move in moves:
+        src_row = move[2] // dim
+        src_col = move[2] % dim
+        name = ["up", "down", "left", "right"][move[4]]
+        verbose(f"Move {name}: ({src_col + 1},{src_row + 1})\n", 2)
     verbose(f"Total moves: {len(moves)}\n", 2)
-    verbose(f"Start State: \n{b_replace(puzzle, True)}\n", 2)
+    verbose(f"Start State: \n{b_replace(state, True)}\n", 2)
     for move in moves:
-        verbose(f"{b_replace(move, True)}\n", 2)
+        verbose(f"{b_replace(move[0], True)}\n", 2)
     verbose("End Legal Moves\n", 2)
-    return moves
+    return
+
+
+# Blank move directions, index is the move code
+# Opposite moves differ only in the lowest bit, so code ^ 1 undoes code
+MOVES = "UDLR"
+
+
+def move_code(move, dim):
+    # Direction the blank moved in a (state, tile, src, dst, ...) move
+    # The blank was at dst and is now at src
+    step = move[2] - move[3]
+    if step == -dim:
+        return 0
+    if step == dim:
+        return 1
+    if step == -1:
+        return 2
+    return 3
 
 
 def solved_state():
     # Returns the solved state of the puzzle.
-    solved = np.array(range(1, SETTINGS["size"] + 1))
-    solved[SETTINGS["size"] - 1] = 0
-    return solved
+    return list(range(1, SETTINGS["size"])) + [0]
+
+
+def set_solve_state():
+    # Set the solved state and the packing layout for the current size
+    # The goal is packed once here so the searches never rebuild it
+    SETTINGS["tile_bits"] = tile_bits(SETTINGS["size"])
+    SETTINGS["tile_mask"] = (1 << SETTINGS["tile_bits"]) - 1
+    SETTINGS["solve_state"] = solved_state()
+    SETTINGS["solve_key"] = pack_state(SETTINGS["solve_state"])
+    SETTINGS["neighbors"] = build_move_tables(int(SETTINGS["size"] ** 0.5))
+    build_heuristic_tables()
+    return
+
+
+def tile_bits(size):
+    # Number of bits used to store a single tile in a packed state
+    # 4 bits covers up to the 4x4 board (tiles 0-15), so the whole board
+    # fits in a 64 bit integer. Bigger boards get wider fields.
+    return max(4, (size - 1).bit_length())
 
 
-def lazy_hash(puzzle):
-    # This is used for the dictionary of visited nodes
-    # It will convert the puzzle to a string
-    # Since each puzzle is unique, the string will be unique
-    str = ""
+def pack_state(puzzle):
+    # Pack the puzzle into a single integer
+    # Tile at position i is stored in bits [i * bits, (i + 1) * bits)
+    # The integer is used directly as the key for the visited dictionary
+    bits = SETTINGS["tile_bits"]
+    key = 0
     for i in range(len(puzzle)):
-        str += "{:02d}".format(puzzle[i])
-    return str
-
-
-def generate_report(puzzle, solution):
-    # Generate a report of the solution
-    # Directory will be ./reports/Algorithm_Heuristic_Size
-    # The file will be named Puzzle_Steps.txt
-    dir = "./reports"
-    dir += f"/{SETTINGS['Algorithm'].__name__}"
-    dir += f"_{SETTINGS['Heuristic'].__name__}"
-    dir += f"_{SETTINGS['size']}"
-    if not os.path.exists(dir):
-        os.makedirs(dir)
+        key |= int(puzzle[i]) << (i * bits)
+    return key
 
-    filename = f"{b_replace(puzzle)}"
-    # Remove all excess characters
-    filename = filename.replace("[", "")
-    filename = filename.replace("]", "")
-    filename = filename.replace(" ", "")
 
-    steps = len(solution)
+def unpack_state(key):
+    # Unpack an integer key back into a list of tiles
+    bits = SETTINGS["tile_bits"]
+    mask = SETTINGS["tile_mask"]
+    return [(key >> (i * bits)) & mask for i in range(SETTINGS["size"])]
 
-    filename = dir + f"/{filename}_{steps}.txt"
 
-    with open(filename, "w") as f:
-        f.write(f"{b_replace(puzzle)} ")
-        for step in solution:
-            f.write(f"{b_replace(step)} ")
+def find_blank(key):
+    # Return the position of the blank tile in a packed state
+    bits = SETTINGS["tile_bits"]
+    mask = SETTINGS["tile_mask"]
+    for i in range(SETTINGS["size"]):
+        if (key >> (i * bits)) & mask == 0:
+            return i
+    return -1
+
+
+def slide(key, blank, target):
+    # Slide the tile at target into the blank position
+    # Since the blank is stored as 0, this is a single swap of two fields
+    bits = SETTINGS["tile_bits"]
+    tile = (key >> (target * bits)) & SETTINGS["tile_mask"]
+    return key ^ (tile << (target * bits)) ^ (tile << (blank * bits))
+
+
+def generate_report(puzzle, moves, stats=None, writer=None):
+    # Add the result of a solve to the results store
+    # The store is one JSON object per line, ./reports/results.jsonl unless
+    # --results is given. Results are only appended, in whole lines (see
+    # ResultWriter), so old results are never rewritten.
+    # moves is the solution as blank moves (see path_moves), None for a
+    # search that ran out of its limits. The boards are not stored, they
+    # are made again from the puzzle and moves when they are needed.
+    # writer is the ResultWriter of a batch, or None to write this result
+    # on its own.
+    if stats is None:
+        stats = SETTINGS.get("search_stats")
+
+    record = {
+        "puzzle": puzzle_text(puzzle),
+        "algorithm": SETTINGS["Algorithm"].__name__,
+        "heuristic": SETTINGS["Heuristic"].__name__,
+        "size": SETTINGS["size"],
+        "steps": None,
+    }
+    peak = None
+    if stats is not None:
+        record.update(stats.as_dict())
+        peak = stats.peak_rss_kb
+    if peak is None:
+        # Solved in this process, not in a batch worker
+        peak = peak_rss_kb()
+    record["peak_rss_kb"] = peak
+    record["moves"] = moves
+    if moves is not None:
+        record["steps"] = solution_steps(moves)
+
+    if writer is not None:
+        writer.write(record)
+        return
+    writer = ResultWriter(SETTINGS["results"])
+    writer.write(record)
+    writer.close()
 
     # Print to stderr
-    sys.stderr.write(f"Report generated: {filename}\n")
+    sys.stderr.write(f"Result saved: {writer.filename}\n")
     return
 
 
-def generate_solvable(n):
-    # Generate n solvable puzzles
-    # The puzzles will be saved in the solvable directory
-    # The puzzles will be named after the puzzle itself
-    # The puzzle will be saved as a string with space delimiters
+def solution_steps(moves):
+    # Steps of a solution as reported: the number of boards on it, the
+    # puzzle and the goal included, so one more than the moves
+    return len(moves) + 1
 
-    # Create directory called "solvable" if it doesn't exist
-    if not os.path.exists("solvable"):
-        os.makedirs("solvable")
 
-    # Create n solvable puzzles
-    for i in range(n):
-        puzzle = random_puzzle(SETTINGS["size"])
+RESULTS_BUFFER = 1 << 16  # Bytes of results a ResultWriter holds at most
 
-        # Write the puzzle to a file
-        text = f"{b_replace(puzzle)}"
-        # remove the brackets
-        text = text.replace("[", "")
-        text = text.replace("]", "")
 
-        title = text.replace(" ", "")
+class ResultWriter:
+    # Appends results to a results store, one JSON object per line
+    # Lines wait in memory until RESULTS_BUFFER bytes of them are waiting
+    # (or flush or close is called), then go out in one write to a file
+    # opened for appending. Only whole lines are written, so runs in
+    # parallel never mix their lines, and compile_reports.py leaves a line
+    # without its newline for later.
+    def __init__(self, filename):
+        dir = os.path.dirname(filename)
+        if dir and not os.path.exists(dir):
+            os.makedirs(dir)
+        self.filename = filename
+        self.fd = os.open(filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.lines = []
+        self.waiting = 0  # Bytes in lines
+        return
 
-        # check if title already exists
-        if os.path.exists(f"solvable/{title}.txt"):
-            i -= 1
-            continue
+    def write(self, record):
+        line = (json.dumps(record) + "\n").encode()
+        self.lines.append(line)
+        self.waiting += len(line)
+        if self.waiting >= RESULTS_BUFFER:
+            self.flush()
+        return
 
-        with open(f"solvable/{title}.txt", "w") as f:
-            f.write(text)
-            f.write("\n")
+    def flush(self):
+        data = b"".join(self.lines)
+        while len(data) > 0:
+            data = data[os.write(self.fd, data) :]
+        self.lines = []
+        self.waiting = 0
+        return
 
+    def close(self):
+        self.flush()
+        os.close(self.fd)
+        return
 
-def best_first_search(puzzle, solve_state, h_func):
-    # Best First Search will use the heuristic to determine the best
-    # next move to take. It will keep making the best move until it
-    # finds a solution. This is a guaranteed result, but not the shortest
-    # path since it doesn't take steps into account.
 
-    start_state = puzzle
-    visited = {}
+def puzzle_text(puzzle):
+    # Space separated tiles with b for the blank, as puzzles are read in
+    if isinstance(puzzle, int):
+        puzzle = unpack_state(puzzle)
+    return " ".join(str(tile) if tile else "b" for tile in puzzle)
 
-    # Create the initial node
-    root = Node(start_state, h_func(start_state))
 
-    # Create a queue of nodes to visit
-    frontier = [root]
-    heapq.heapify(frontier)
+def peak_rss_kb():
+    # Peak memory of this process so far, in KB (None if unknown)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak // 1024  # macOS reports bytes
+    return peak
 
-    # While there are still nodes to visit, keep going
-    while len(frontier) > 0:
-        # Get the node with the lowest heuristic value
-        # The f == h for this algorithm.
-        node = heapq.heappop(frontier)
 
-        # Check if the node is the solution
-        if lazy_hash(node.state) == lazy_hash(solve_state):
-            solution = []
-            while node is not None:
-                solution.insert(0, node.state)
-                node = node.parent
-            return solution
+# Settings copied into every --batch worker process
+WORKER_SETTINGS = [
+    "verbose",
+    "debug",
+    "stats",
+    "tt_size",
+    "weight",
+    "weight_step",
+    "cache",
+    "cache_size",
+    "results",
+    "queue",
+    "tie_break",
+    "expand_batch",
+    "search_workers",
+    "external_dir",
+    "external_buffer",
+    "time_limit",
+    "node_limit",
+]
 
-        # Add the node to the visited list
-        visited[lazy_hash(node.state)] = node.f
 
-        # Get all the legal moves
-        moves = legal_moves(node.state)
+def load_puzzles(path):
+    # Read every puzzle from a file, or from every file in a directory
+    # Each non empty line is one puzzle, invalid or unsolvable ones are skipped
+    if os.path.isdir(path):
+        files = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+    else:
+        files = [path]
 
-        # Create the new nodes
-        for move in moves:
-            new_node = Node(move, h_func(move), node)
-            if lazy_hash(new_node.state) not in visited:
-                heapq.heappush(frontier, new_node)
+    puzzles = []
+    for filename in files:
+        with open(filename, "r") as f:
+            for line in f:
+                if line.strip() == "":
+                    continue
+                puzzle = parse_puzzle(line)
+                if puzzle is None:
+                    perror(f" ({filename})\n")
+                    continue
+                if not solvable(puzzle):
+                    perror(f"Skipping unsolvable puzzle: {line.strip()}\n")
+                    continue
+                puzzles.append([int(x) for x in puzzle])
+    return puzzles
 
 
-def a_star(puzzle, solve_state, h_func):
-    # A* is uses most of the same code as Best First Search, but it
-    # takes into account the steps taken to get to the current state.
-    # This will guarantee the shortest path to the solution, but might take
-    # longer to find the solution
+def run_batch(path):
+    # Solve every puzzle in path with every algorithm and heuristic given
+    # The puzzles are loaded once and the solves run in a process pool.
+    # Results are reported as soon as each one finishes.
+    puzzles = load_puzzles(path)
+    tasks = []
+    for algorithm in SETTINGS["Algorithms"]:
+        for heuristic in SETTINGS["Heuristics"]:
+            for puzzle in puzzles:
+                tasks.append((puzzle, algorithm.__name__, heuristic.__name__))
+    perror(f"Batch: {len(puzzles)} puzzles, {len(tasks)} solves\n")
 
-    start_state = puzzle
-    visited = {}
+    from concurrent.futures import ProcessPoolExecutor, as_completed
 
-    # Create the initial node
-    root = Node(start_state, h_func(start_state), g=0)
+    options = {key: SETTINGS[key] for key in WORKER_SETTINGS}
+    failed = 0
+    writer = ResultWriter(SETTINGS["results"])
+    try:
+        with ProcessPoolExecutor(
+            max_workers=SETTINGS["workers"],
+            initializer=init_worker,
+            initargs=(options,),
+        ) as pool:
+            futures = [pool.submit(solve_task, *task) for task in tasks]
+            for future in as_completed(futures):
+                puzzle, algorithm, heuristic, moves, stats = future.result()
+                if not batch_result(puzzle, algorithm, heuristic, moves, stats, writer):
+                    failed += 1
+    finally:
+        writer.close()
 
-    # Create a queue of nodes to visit
-    frontier = [root]
-    heapq.heapify(frontier)
+    perror(f"Results saved: {writer.filename}\n")
+    perror(f"Batch done: {len(tasks) - failed} solved, {failed} failed\n")
+    return
 
-    # While there are still nodes to visit, keep going
-    while len(frontier) > 0:
-        # Get the node with the lowest f value (g + h)
-        node = heapq.heappop(frontier)
 
-        # Check if the node is the solution
-        if lazy_hash(node.state) == lazy_hash(solve_state):
-            solution = []
-            while node is not None:
-                solution.insert(0, node.state)
-                node = node.parent
-            return solution
+def init_worker(options):
+    # Runs once in every batch worker process
+    # Progress lines would mix with the results, so workers print none
+    SETTINGS.update(options)
+    SETTINGS["size"] = 0
+    SETTINGS["progress"] = False
+    return
+
 
-        # Add the node to the visited list
-        visited[lazy_hash(node.state)] = node.f
+def solve_task(puzzle, algorithm, heuristic):
+    # Solve one puzzle in a batch worker
+    # Lookup tables stay loaded in the worker between tasks of the same size
+    # The solution is sent back as its moves (None if not solved), and the
+    # peak memory is taken here, in the worker that searched. ru_maxrss
+    # never goes down, so it is the worker's peak so far: the largest
+    # search it has run yet, not only this one.
+    # A solve that can't run (a missing table, a size the heuristic does
+    # not support) comes back unsolved with status error, so the rest of
+    # the batch still runs.
+    if SETTINGS["size"] != len(puzzle):
+        set_size(len(puzzle))
+    SETTINGS["Algorithm"] = globals()[algorithm]
+    SETTINGS["Heuristic"] = globals()[heuristic]
+    try:
+        solution = get_solution(puzzle)
+    except Exception as error:
+        solution = None
+        new_stats().stop("error")
+        SETTINGS["search_stats"].error = str(error)
+    moves = None
+    if solution is not None:
+        moves = path_moves(solution)
+    stats = SETTINGS["search_stats"]
+    stats.peak_rss_kb = peak_rss_kb()
+    return puzzle, algorithm, heuristic, moves, stats
 
-        # Get all the legal moves
-        moves = legal_moves(node.state)
 
-        # Create the new nodes
-        for move in moves:
-            new_node = Node(move, h_func(move), node, node.g + 1)
-            if lazy_hash(new_node.state) not in visited:
-                heapq.heappush(frontier, new_node)
-            elif visited[lazy_hash(new_node.state)] > node.f:
-                heapq.heappush(frontier, new_node)
+def batch_result(puzzle, algorithm, heuristic, moves, stats, writer):
+    # Print one batch result and add it to the results store
+    # Returns True if the puzzle was solved
+    if SETTINGS["size"] != len(puzzle):
+        set_size(len(puzzle))
+    SETTINGS["Algorithm"] = globals()[algorithm]
+    SETTINGS["Heuristic"] = globals()[heuristic]
+    text = b_replace(puzzle)
+    if moves is None:
+        print(f"{algorithm} {heuristic} {text} failed ({stats.line()})", flush=True)
+        generate_report(puzzle, None, stats, writer)
+        return False
 
-    return None
+    steps = solution_steps(moves)
+    print(f"{algorithm} {heuristic} {text} steps={steps} ({stats.line()})", flush=True)
+    generate_report(puzzle, moves, stats, writer)
+    return True
 
 
-class Node:
-    # Node class for the A* and Best First Search algorithms
-    def __init__(self, state, h, parent=None, g=0):
-        self.parent = parent  # Parent node
-        self.state = state  # Current state of the puzzle
-        self.h = h  # Heuristic value
-        self.g = g  # Steps taken to get to this node(not used in BFS)
-        self.f = g + h  # The actual value of the node
-        return
+def run_serve(socket_path, algorithms, heuristics):
+    # Answer solve requests until the input ends, or forever on a socket
+    # Requests and answers are JSON objects, one per line (see README.md)
+    # asyncio is only imported by the service, at the top of the file it
+    # would add ~7MB (ssl and friends) to the memory of every solve
+    import asyncio
 
-    # Comparison operators
-    def __lt__(self, other):
-        return self.f < other.f
+    if SETTINGS["max_pending"] == 0:
+        SETTINGS["max_pending"] = 4 * SETTINGS["workers"]
+    try:
+        asyncio.run(serve(socket_path, algorithms, heuristics))
+    except KeyboardInterrupt:
+        perror("Service stopped\n")
+    return
+
+
+async def serve(socket_path, algorithms, heuristics):
+    # The asyncio front end: stdin/stdout, or every client of a Unix socket
+    import asyncio
+
+    service = SolveService(algorithms, heuristics)
+    try:
+        if socket_path is None:
+            loop = asyncio.get_running_loop()
+
+            def readline():
+                # Read in a thread, stdin may be a file or a terminal
+                return loop.run_in_executor(None, sys.stdin.buffer.readline)
+
+            def write(answer):
+                sys.stdout.write(json.dumps(answer) + "\n")
+                sys.stdout.flush()
+
+            await service.handle(readline, write)
+        else:
+
+            async def client(reader, writer):
+                def write(answer):
+                    writer.write((json.dumps(answer) + "\n").encode())
+
+                try:
+                    await service.handle(reader.readline, write)
+                finally:
+                    writer.close()
+
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            server = await asyncio.start_unix_server(client, path=socket_path)
+            perror(f"Serving on {socket_path}\n")
+            async with server:
+                await server.serve_forever()
+    finally:
+        service.pool.shutdown(cancel_futures=True)
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
+    return
 
-    def __eq__(self, other):
-        return self.state == other.state
 
-    def __lte__(self, other):
-        return self.f <= other.f
+class SolveService:
+    # Solves --serve requests on a pool of --workers processes
+    # The workers live as long as the service, so the heuristic tables,
+    # pattern databases and --cache stay loaded between requests.
+    # Every request being solved holds one of --max-pending slots. When
+    # they are all taken a new request is answered "busy" at once, instead
+    # of piling up behind the others. Each slot has a flag in a shared
+    # array: setting it makes the search stop at its next budget check
+    # (see SearchStats.over_budget), which is how requests are cancelled.
+    def __init__(self, algorithms, heuristics):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.algorithms = algorithms
+        self.heuristics = heuristics
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+        self.flags = context.Array("b", SETTINGS["max_pending"], lock=False)
+        self.free = list(range(SETTINGS["max_pending"]))
+        self.running = {}  # (client, request id) -> (future, slot)
+        options = {key: SETTINGS[key] for key in WORKER_SETTINGS}
+        self.pool = ProcessPoolExecutor(
+            max_workers=SETTINGS["workers"],
+            mp_context=context,
+            initializer=init_serve_worker,
+            initargs=(options, self.flags),
+        )
+        return
 
-    def __gt__(self, other):
-        return self.f > other.f
+    async def handle(self, readline, write):
+        # Read the requests of one client until its input ends
+        # Solves run side by side, and each answer is written when ready
+        # {"cancel": id} stops the client's request with that id
+        import asyncio
+
+        client = object()
+        tasks = set()
+        while True:
+            line = await readline()
+            if not line:
+                break
+            if line.strip() == b"":
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError:
+                write({"id": None, "status": "error", "error": "Invalid JSON"})
+                continue
+            if not isinstance(request, dict):
+                write({"id": None, "status": "error", "error": "Expected an object"})
+                continue
+            if "cancel" in request:
+                if not self.cancel(client, request["cancel"]):
+                    answer = {"id": request["cancel"], "status": "error"}
+                    answer["error"] = "No such request running"
+                    write(answer)
+                continue
+            task = asyncio.ensure_future(self.solve(client, request, write))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        # Let the requests already taken finish before closing
+        if len(tasks) > 0:
+            await asyncio.gather(*tasks)
+        return
+
+    async def solve(self, client, request, write):
+        # Solve one request in the pool and write its answer
+        import asyncio
+
+        answer = {"id": request.get("id")}
+        key = (client, answer["id"])
+        if answer["id"] is None:
+            # Requests without an id can't be cancelled, so they get a key of
+            # their own instead of sharing (client, None)
+            key = (client, object())
+        try:
+            task = self.task(request)
+        except (ValueError, FileNotFoundError) as error:
+            answer.update(status="error", error=str(error))
+            write(answer)
+            return
+        if key in self.running:
+            answer.update(status="error", error="Duplicate id")
+            write(answer)
+            return
+        if len(self.free) == 0:
+            answer["status"] = "busy"
+            write(answer)
+            return
+
+        slot = self.free.pop()
+        self.flags[slot] = 0
+        future = self.pool.submit(serve_task, *task, slot)
+        self.running[key] = (future, slot)
+        try:
+            answer.update(await asyncio.wrap_future(future))
+        except asyncio.CancelledError:
+            # Cancelled before a worker picked it up
+            answer["status"] = "cancelled"
+        except BaseException as error:
+            # Whatever the worker raised (SystemExit too) only fails this
+            # request, the service keeps answering the others
+            answer.update(status="error", error=f"{type(error).__name__}: {error}")
+        finally:
+            del self.running[key]
+            self.free.append(slot)
+        write(answer)
+        return
+
+    def cancel(self, client, request_id):
+        # Stop a request, returns False if it is not running
+        entry = self.running.get((client, request_id))
+        if entry is None:
+            return False
+        future, slot = entry
+        self.flags[slot] = 1
+        future.cancel()
+        return True
+
+    def task(self, request):
+        # Arguments of serve_task for a request, ValueError if it is invalid
+        # (FileNotFoundError for a table that was not built)
+        # "puzzle" is a string like the input ("1 2 3 b 4 ...") or a list,
+        # "algorithm" and "heuristic" are numbers like -a and -H or names,
+        # "deadline" is seconds from now and "node_limit" a node count
+        puzzle = request.get("puzzle")
+        if isinstance(puzzle, list):
+            puzzle = " ".join(str(tile) for tile in puzzle)
+        if not isinstance(puzzle, str):
+            raise ValueError("Missing puzzle")
+        parsed = parse_puzzle(puzzle)
+        if parsed is None:
+            raise ValueError("Invalid puzzle")
+        if not solvable(parsed):
+            raise ValueError("Puzzle is not solvable")
+        algorithm = self.choose(request.get("algorithm"), self.algorithms, "algorithm")
+        heuristic = self.choose(request.get("heuristic"), self.heuristics, "heuristic")
+        check_combination(len(parsed), algorithm, heuristic)
+        try:
+            deadline = float(request.get("deadline", SETTINGS["time_limit"]))
+            node_limit = int(request.get("node_limit", SETTINGS["node_limit"]))
+        except (TypeError, ValueError):
+            raise ValueError("Invalid deadline or node_limit")
+        if deadline > 0:
+            deadline = time.time() + deadline
+        return (
+            [int(tile) for tile in parsed],
+            algorithm.__name__,
+            heuristic.__name__,
+            deadline,
+            node_limit,
+        )
+
+    def choose(self, value, choices, kind):
+        # Pick an algorithm or heuristic by number or name, default from -a/-H
+        if value is None:
+            return SETTINGS[kind.capitalize()]
+        for number, choice in enumerate(choices, 1):
+            if value == number or value == choice.__name__:
+                return choice
+        raise ValueError(f"Invalid {kind}: {value}")
+
+
+def init_serve_worker(options, flags):
+    # Runs once in every --serve worker process
+    init_worker(options)
+    SETTINGS["cancel_flags"] = flags
+    return
+
+
+def serve_task(puzzle, algorithm, heuristic, deadline, node_limit, slot):
+    # Solve one --serve request in a worker and return the answer fields
+    # deadline is a wall clock time (0 for none), slot the request's flag
+    flags = SETTINGS["cancel_flags"]
+    if flags[slot]:
+        return {"status": "cancelled"}
+    SETTINGS["time_limit"] = 0
+    if deadline > 0:
+        SETTINGS["time_limit"] = deadline - time.time()
+        if SETTINGS["time_limit"] <= 0:
+            return {"status": "budget"}
+    SETTINGS["node_limit"] = node_limit
+    SETTINGS["cancel"] = (flags, slot)
+    try:
+        result = solve_task(puzzle, algorithm, heuristic)
+    finally:
+        SETTINGS["cancel"] = None
+
+    puzzle, algorithm, heuristic, moves, stats = result
+    answer = {"algorithm": algorithm, "heuristic": heuristic}
+    answer.update(stats.as_dict())
+    if moves is None and flags[slot]:
+        answer["status"] = "cancelled"
+    answer["steps"] = None
+    answer["moves"] = moves
+    if moves is not None:
+        answer["steps"] = solution_steps(moves)
+    return answer
+
+
+def generate_solvable(n):
+    # Generate n unique solvable puzzles
+    # The puzzles are saved in one file, one per line, space delimited
+    # (./solvable/puzzles_<size>.txt unless --output is given)
+    # With --distance or --min-distance, only puzzles that far from the
+    # goal (in optimal moves) are kept
+    # Returns the name of the file
+    import numpy as np
+
+    size = SETTINGS["size"]
+    rng = np.random.default_rng(SETTINGS["seed"])
+    if SETTINGS["distance"] is not None or SETTINGS["min_distance"] is not None:
+        puzzles = distance_puzzles(n, size, rng)
+    else:
+        puzzles = unique_puzzles(n, size, rng)
+
+    filename = SETTINGS["output"]
+    if filename is None:
+        filename = f"./solvable/puzzles_{size}.txt"
+    dir = os.path.dirname(filename)
+    if dir and not os.path.exists(dir):
+        os.makedirs(dir)
+    with open(filename, "w") as f:
+        for puzzle in puzzles:
+            f.write(puzzle_text(puzzle) + "\n")
+    return filename
+
+
+def unique_puzzles(n, size, rng):
+    # n different random solvable puzzles, drawn in batches
+    possible = permutation_count(size, size) // 2
+    if n > possible:
+        perror(f"Only {possible} solvable puzzles of size {size} exist\n")
+        exit(1)
+    found = {}
+    while len(found) < n:
+        for puzzle in random_puzzles(n - len(found), size, rng):
+            found.setdefault(puzzle.tobytes(), puzzle)
+    return list(found.values())
+
+
+def distance_puzzles(n, size, rng):
+    # n different puzzles exactly --distance or at least --min-distance
+    # optimal moves from the goal.
+    # 3x3: picked straight from the perfect distance table.
+    # Bigger boards: random walks from the goal. A walk's end is at most
+    # its length away, and at least the linear conflict (or pattern
+    # database) value. When those do not settle it, IDA* does.
+    # Walk lengths follow the target, longer walks mostly end farther
+    # away than asked and are thrown out. For --distance every walk is
+    # exactly that long: on 4x4 that ends at the distance 65% of the time
+    # for 20 moves and 30% for 30, against 3-5% for walks 8 moves longer.
+    # For --min-distance the walk starts at the minimum and grows by 2
+    # moves after a walk that ended too close, shrinking by 2 after one
+    # that did not. It settles where about half the walks are far enough,
+    # so the puzzles are not much farther than the minimum.
+    import numpy as np
+
+    exact = SETTINGS["distance"]
+    minimum = SETTINGS["min_distance"]
+    if size == 9:
+        dist = np.frombuffer(get_perfect()["map"], dtype=np.uint8)
+        if exact is not None:
+            ranks = np.flatnonzero(dist == exact)
+        else:
+            ranks = np.flatnonzero((dist >= minimum) & (dist != 255))
+        if len(ranks) < n:
+            perror(f"Only {len(ranks)} puzzles of size {size} are that far\n")
+            exit(1)
+        chosen = rng.choice(ranks, n, replace=False)
+        return [permutation_unrank(int(rank), size) for rank in chosen]
+
+    h_func = h5_linear_conflict
+    if os.path.exists(pdb_filename(size)):
+        h_func = h4_pdb
+    goal = SETTINGS["solve_key"]
+    found = {}
+    attempts = 0
+    steps = exact if exact is not None else minimum
+    while len(found) < n:
+        attempts += 1
+        if attempts > 1000 * n:
+            perror(f"Gave up after {attempts} walks, found {len(found)} puzzles\n")
+            exit(1)
+        state = random_walk(goal, steps, rng)
+        if state in found:
+            continue
+        lower = h_func(state)
+        if exact is not None:
+            # lower <= optimal <= steps == exact, solve it unless they meet
+            if lower < exact:
+                solution = ida_star(state, goal, h_func)
+                if solution is None or len(solution) - 1 != exact:
+                    continue
+        elif lower < minimum:
+            steps += 2
+            continue
+        else:
+            steps = max(minimum, steps - 2)
+        found[state] = unpack_state(state)
+        verbose(f"Found {len(found)}/{n} after {attempts} walks\n")
+    return list(found.values())
+
+
+def random_walk(state, steps, rng):
+    # Make random moves from state, never undoing the last one
+    blank = find_blank(state)
+    last = -1
+    for _ in range(steps):
+        moves = list(successors(state, blank, last))
+        state, tile, blank, dst, last = moves[int(rng.integers(len(moves)))]
+    return state
+
+
+def tile_positions(state):
+    # Return a list where index is the tile and value is its position
+    bits = SETTINGS["tile_bits"]
+    mask = SETTINGS["tile_mask"]
+    positions = [0] * SETTINGS["size"]
+    for i in range(SETTINGS["size"]):
+        positions[(state >> (i * bits)) & mask] = i
+    return positions
+
+
+def default_patterns(size):
+    # Default disjoint tile groups for the pattern database
+    # 3x3: 4-4, 4x4: 6-6-3, 5x5: 6-6-6-6 is too big to build here, so 5-5-5-5-4
+    if size == 9:
+        return [[1, 2, 3, 4], [5, 6, 7, 8]]
+    if size == 16:
+        return [[1, 5, 6, 9, 10, 13], [7, 8, 11, 12, 14, 15], [2, 3, 4]]
+    if size == 25:
+        return [
+            [1, 2, 3, 6, 7],
+            [4, 5, 8, 9, 10],
+            [11, 12, 13, 16, 17],
+            [14, 15, 18, 19, 20],
+            [21, 22, 23, 24],
+        ]
+    # Otherwise, group the tiles 4 at a time in order
+    tiles = list(range(1, size))
+    return [tiles[i : i + 4] for i in range(0, len(tiles), 4)]
+
+
+def parse_patterns(text):
+    # Parse tile groups from the command line, e.g. "1,2,3/4,5,6"
+    try:
+        patterns = [[int(x) for x in group.split(",")] for group in text.split("/")]
+    except ValueError:
+        perror(f"Invalid patterns: {text}\n")
+        exit(2)
+    tiles = [tile for group in patterns for tile in group]
+    if len(tiles) != len(set(tiles)) or 0 in tiles:
+        perror("Invalid patterns: Groups must be disjoint and not contain b\n")
+        exit(2)
+    return patterns
+
+
+def pdb_missing(size):
+    # The error for a pattern database that was never built
+    return FileNotFoundError(
+        f"Pattern database not found: {pdb_filename(size)}\n"
+        f"Build it with: slidingtiles.py --build-pdb -s {size}"
+    )
+
+
+def pdb_filename(size):
+    # Pattern databases are stored in ./tables/pdb_<size>.bin
+    return f"./tables/pdb_{size}.bin"
+
+
+def permutation_count(n, k):
+    # Number of ways to place k distinct tiles on n squares
+    count = 1
+    for i in range(k):
+        count *= n - i
+    return count
+
+
+def pattern_rank(positions, tiles):
+    # Rank the positions of the pattern tiles into 0..n!/(n-k)! - 1
+    # Digit i is the position of tile i among the squares not used by the
+    # tiles before it, so every placement gets a unique index
+    n = len(positions)
+    rank = 0
+    for i in range(len(tiles)):
+        pos = positions[tiles[i]]
+        digit = pos
+        for j in range(i):
+            if positions[tiles[j]] < pos:
+                digit -= 1
+        rank = rank * (n - i) + digit
+    return rank
+
+
+def rank_positions(pos, n):
+    # Vectorized pattern_rank, pos is an (N, k) array of tile positions
+    import numpy as np
+
+    rank = np.zeros(len(pos), dtype=np.int64)
+    for i in range(pos.shape[1]):
+        digit = pos[:, i].astype(np.int64)
+        for j in range(i):
+            digit -= pos[:, j] < pos[:, i]
+        rank = rank * (n - i) + digit
+    return rank
+
+
+def unrank_positions(rank, n, k):
+    # Inverse of rank_positions, returns an (N, k) array of positions
+    import numpy as np
+
+    digits = np.zeros((len(rank), k), dtype=np.int64)
+    rank = rank.copy()
+    for i in range(k - 1, -1, -1):
+        digits[:, i] = rank % (n - i)
+        rank //= n - i
+
+    pos = np.zeros((len(rank), k), dtype=np.int64)
+    for i in range(k):
+        p = digits[:, i].copy()
+        # Skip over the squares already taken, smallest first
+        taken = np.sort(pos[:, :i], axis=1)
+        for j in range(i):
+            p += taken[:, j] <= p
+        pos[:, i] = p
+    return pos
+
+
+def expand_pattern(index, n, k, dim, tile_moves):
+    # Expand abstract states (rank * n + blank) by one blank move
+    # If tile_moves is False, only moves of the blank into free squares
+    # (cost 0). If True, only moves that slide a pattern tile (cost 1).
+    import numpy as np
+
+    rank = index // n
+    blank = index % n
+    pos = unrank_positions(rank, n, k)
+    children = []
+    directions = [
+        (-dim, blank >= dim),
+        (dim, blank < n - dim),
+        (-1, blank % dim > 0),
+        (1, blank % dim < dim - 1),
+    ]
+    for offset, valid in directions:
+        target = blank + offset
+        hit = pos == target[:, None]
+        is_tile = hit.any(axis=1)
+        if tile_moves:
+            selected = valid & is_tile
+            moved = pos[selected]
+            # Each row has exactly one hit, the tile slides into the blank
+            moved[hit[selected]] = blank[selected]
+            children.append(rank_positions(moved, n) * n + target[selected])
+        else:
+            selected = valid & ~is_tile
+            children.append(rank[selected] * n + target[selected])
+    return np.concatenate(children)
+
+
+def expand_unseen(frontier, dist, n, k, dim, tile_moves):
+    # Expand the frontier in chunks and keep only states not seen yet
+    import numpy as np
+
+    CHUNK = 1 << 18
+    found = []
+    for i in range(0, len(frontier), CHUNK):
+        children = expand_pattern(frontier[i : i + CHUNK], n, k, dim, tile_moves)
+        found.append(children[dist[children] == 255])
+    if len(found) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.unique(np.concatenate(found))
+
+
+def pattern_bfs(size, tiles):
+    # Backward breadth first search from the solved state over the
+    # abstract space of (pattern tile positions, blank position).
+    # Only moves of pattern tiles cost 1, so the search goes layer by layer:
+    # first every state the blank can reach for free, then one tile move.
+    # The stored value is the minimum over all blank positions.
+    import numpy as np
+
+    n = size
+    k = len(tiles)
+    dim = int(size ** 0.5)
+    count = permutation_count(n, k)
+    dist = np.full(count * n, 255, dtype=np.uint8)
+
+    goal = np.array([[tile - 1 for tile in tiles]], dtype=np.int64)
+    frontier = rank_positions(goal, n) * n + (n - 1)
+    dist[frontier] = 0
+    depth = 0
+    while len(frontier) > 0:
+        layer = [frontier]
+        new = frontier
+        while len(new) > 0:
+            new = expand_unseen(new, dist, n, k, dim, False)
+            dist[new] = depth
+            layer.append(new)
+        frontier = expand_unseen(np.concatenate(layer), dist, n, k, dim, True)
+        dist[frontier] = depth + 1
+        verbose(f"Pattern {tiles} depth {depth}: {sum(len(x) for x in layer)}\n")
+        depth += 1
+
+    return dist.reshape(count, n).min(axis=1)
+
+
+PDB_MAGIC = b"STPD"
+PDB_VERSION = 1
+
+
+def build_pdb(size, patterns, filename):
+    # Build every pattern table and write them to one file
+    # Header: magic, version, board size, number of patterns
+    # Then per pattern: tile count, tiles, table offset and length
+    # Then the tables, one byte per entry
+    tables = []
+    for tiles in patterns:
+        perror(f"Building pattern {tiles}...\n")
+        tables.append(pattern_bfs(size, tiles))
+
+    header = struct.pack("<4sHHH", PDB_MAGIC, PDB_VERSION, size, len(patterns))
+    header_size = len(header)
+    for tiles in patterns:
+        header_size += struct.calcsize("<H") + len(tiles) + struct.calcsize("<QQ")
+
+    offset = header_size
+    for tiles, table in zip(patterns, tables):
+        header += struct.pack("<H", len(tiles)) + bytes(tiles)
+        header += struct.pack("<QQ", offset, len(table))
+        offset += len(table)
+
+    dir = os.path.dirname(filename)
+    if dir and not os.path.exists(dir):
+        os.makedirs(dir)
+    with open(filename, "wb") as f:
+        f.write(header)
+        for table in tables:
+            f.write(table.tobytes())
+    return
+
+
+def load_pdb(filename):
+    # Memory map a pattern database file
+    # Nothing is read up front, pages are loaded as the search touches them
+    with open(filename, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, size, count = struct.unpack_from("<4sHHH", data, 0)
+    if magic != PDB_MAGIC or version != PDB_VERSION:
+        raise ValueError(f"Invalid pattern database: {filename}")
+
+    patterns = []
+    tile_pattern = {}
+    pos = struct.calcsize("<4sHHH")
+    for i in range(count):
+        (k,) = struct.unpack_from("<H", data, pos)
+        pos += struct.calcsize("<H")
+        tiles = list(data[pos : pos + k])
+        pos += k
+        offset, length = struct.unpack_from("<QQ", data, pos)
+        pos += struct.calcsize("<QQ")
+        patterns.append((tiles, offset))
+        for tile in tiles:
+            tile_pattern[tile] = i
+
+    return {"size": size, "map": data, "patterns": patterns, "tile_pattern": tile_pattern}
+
+
+def get_pdb():
+    # Load the pattern database for the current size the first time it is used
+    pdb = SETTINGS.get("pdb")
+    if pdb is not None and pdb["size"] == SETTINGS["size"]:
+        return pdb
+
+    filename = pdb_filename(SETTINGS["size"])
+    if not os.path.exists(filename):
+        raise pdb_missing(SETTINGS["size"])
+    SETTINGS["pdb"] = load_pdb(filename)
+    return SETTINGS["pdb"]
+
+
+def permutation_rank(state):
+    # Rank a whole board into 0..n! - 1 (Myrvold & Ruskey)
+    # perm[i] is the tile at square i. The last square's tile is the digit,
+    # then it is swapped out of the way and the board shrinks by one.
+    # Linear time, unlike the Lehmer code used for pattern_rank.
+    n = SETTINGS["size"]
+    bits = SETTINGS["tile_bits"]
+    mask = SETTINGS["tile_mask"]
+    perm = [(state >> (i * bits)) & mask for i in range(n)]
+    inverse = [0] * n
+    for i in range(n):
+        inverse[perm[i]] = i
+
+    rank = 0
+    scale = 1
+    for i in range(n - 1, 0, -1):
+        tile = perm[i]
+        j = inverse[i]
+        perm[i], perm[j] = perm[j], perm[i]
+        inverse[tile], inverse[i] = inverse[i], inverse[tile]
+        rank += tile * scale
+        scale *= i + 1
+    return rank
+
+
+def permutation_unrank(rank, n):
+    # Inverse of permutation_rank, returns the tile on every square
+    perm = list(range(n))
+    for i in range(n, 0, -1):
+        j = rank % i
+        perm[i - 1], perm[j] = perm[j], perm[i - 1]
+        rank //= i
+    return perm
+
+
+def perfect_filename(size):
+    # Perfect distance tables are stored in ./tables/perfect_<size>.bin
+    return f"./tables/perfect_{size}.bin"
+
+
+def perfect_bfs(size):
+    # Breadth first search from the goal over every reachable board
+    # dist[permutation_rank(state)] is the number of moves to the goal,
+    # 255 for the boards that can not be reached (the other parity half)
+    count = permutation_count(size, size)
+    dist = bytearray([255]) * count
+    goal = SETTINGS["solve_key"]
+    dist[permutation_rank(goal)] = 0
+    frontier = [goal]
+    depth = 0
+    while len(frontier) > 0:
+        verbose(f"Perfect table depth {depth}: {len(frontier)}\n")
+        depth += 1
+        next_frontier = []
+        for state in frontier:
+            for move in legal_moves(state):
+                rank = permutation_rank(move[0])
+                if dist[rank] == 255:
+                    dist[rank] = depth
+                    next_frontier.append(move[0])
+        frontier = next_frontier
+    return dist
+
+
+PERFECT_MAGIC = b"STPF"
+PERFECT_VERSION = 1
+
+
+def build_perfect(size, filename):
+    # Build the perfect distance table and write it to filename
+    # Header: magic, version, board size, number of entries
+    # Then one byte per entry, indexed by permutation_rank
+    dist = perfect_bfs(size)
+    header = struct.pack("<4sHHI", PERFECT_MAGIC, PERFECT_VERSION, size, len(dist))
+
+    dir = os.path.dirname(filename)
+    if dir and not os.path.exists(dir):
+        os.makedirs(dir)
+    # Write next to it and rename, so batch workers never see half a file
+    temp = f"{filename}.{os.getpid()}"
+    with open(temp, "wb") as f:
+        f.write(header)
+        f.write(dist)
+    os.replace(temp, filename)
+    return
+
+
+def load_perfect(filename):
+    # Memory map a perfect distance table file
+    # The map is sliced past the header so it can be indexed by rank
+    with open(filename, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, size, count = struct.unpack_from("<4sHHI", data, 0)
+    if magic != PERFECT_MAGIC or version != PERFECT_VERSION:
+        raise ValueError(f"Invalid perfect distance table: {filename}")
+    table = memoryview(data)[struct.calcsize("<4sHHI") :]
+    return {"size": size, "map": table}
+
+
+def get_perfect():
+    # Load the perfect distance table for the current size on first use
+    # It is built (a few seconds) and saved the first time it is needed
+    table = SETTINGS.get("perfect")
+    if table is not None and table["size"] == SETTINGS["size"]:
+        return table
+
+    if SETTINGS["size"] != 9:
+        raise ValueError("The perfect distance table is only supported for 3x3")
+    filename = perfect_filename(SETTINGS["size"])
+    if not os.path.exists(filename):
+        perror(f"Building perfect distance table: {filename}\n")
+        build_perfect(SETTINGS["size"], filename)
+    SETTINGS["perfect"] = load_perfect(filename)
+    return SETTINGS["perfect"]
+
+
+def reflect_tables(size):
+    # Reflection of the board over its main diagonal (transpose)
+    # squares[i] is where square i goes, tiles[t] is what tile t becomes.
+    # The tiles are relabeled so the goal maps onto itself, which means a
+    # state and its reflection are the same distance from the goal.
+    dim = int(size ** 0.5)
+    squares = [(i % dim) * dim + i // dim for i in range(size)]
+    tiles = [0] + [squares[tile - 1] + 1 for tile in range(1, size)]
+    return squares, tiles
+
+
+def reflect_state(state):
+    # Reflect a packed state over the main diagonal
+    squares, tiles = SETTINGS["reflect_tables"]
+    bits = SETTINGS["tile_bits"]
+    mask = SETTINGS["tile_mask"]
+    reflected = 0
+    for i in range(SETTINGS["size"]):
+        tile = (state >> (i * bits)) & mask
+        reflected |= tiles[tile] << (squares[i] * bits)
+    return reflected
+
+
+# Blank moves of a reflected board, up and left swap, down and right swap
+REFLECT_MOVES = str.maketrans("UDLR", "LRUD")
+
+
+def path_moves(solution):
+    # Turn a list of states into the blank moves between them (see MOVES)
+    dim = SETTINGS["matrix_dim"]
+    moves = ""
+    blank = find_blank(solution[0])
+    for state in solution[1:]:
+        target = find_blank(state)
+        moves += MOVES[move_code((state, 0, target, blank), dim)]
+        blank = target
+    return moves
+
+
+def apply_moves(state, moves):
+    # Turn blank moves back into the list of states, starting with state
+    return list(replay_moves(state, moves))
+
+
+def replay_moves(state, moves):
+    # Yield state and then the state after each blank move, one at a time
+    dim = SETTINGS["matrix_dim"]
+    offsets = {"U": -dim, "D": dim, "L": -1, "R": 1}
+    blank = find_blank(state)
+    yield state
+    for move in moves:
+        target = blank + offsets[move]
+        state = slide(state, blank, target)
+        yield state
+        blank = target
+
+
+def cache_filename(size):
+    # Solution caches are stored in ./cache/solutions_<size>.db
+    return f"./cache/solutions_{size}.db"
+
+
+class SolutionCache:
+    # Optimal solutions saved across runs, as blank move strings
+    # disk: sqlite table keyed by the canonical state, the smaller of a
+    # state and its reflection, so a reflected puzzle hits the same entry.
+    # memory: the most recently used states in both orientations (LRU), so
+    # a search can check any state with a plain dict lookup. While every
+    # saved state fits in it, a state missing from memory is not saved at
+    # all and the database is not asked. stored only counts the rows there
+    # at open and the ones this process adds, so rows other processes add
+    # meanwhile can be missed, which only costs a cache hit.
+    # Every suffix of an optimal path is optimal, so each state on a
+    # solution gets its own entry.
+    def __init__(self, filename, capacity):
+        dir = os.path.dirname(filename)
+        if dir and not os.path.exists(dir):
+            os.makedirs(dir)
+        self.db = sqlite3.connect(filename, timeout=60)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS solutions (state BLOB PRIMARY KEY, moves TEXT)"
+        )
+        self.capacity = capacity
+        self.memory = OrderedDict()
+        self.key_bytes = (SETTINGS["size"] * SETTINGS["tile_bits"] + 7) // 8
+        self.stored = self.db.execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+        # Start warm with whatever fits in memory
+        rows = self.db.execute(
+            "SELECT state, moves FROM solutions LIMIT ?", (capacity // 2,)
+        )
+        for key, moves in rows:
+            self.remember(int.from_bytes(key, "little"), moves)
+        return
+
+    def canonical(self, state):
+        # The key a state is stored under, and whether it was reflected
+        reflected = reflect_state(state)
+        if reflected < state:
+            return reflected, True
+        return state, False
+
+    def remember(self, state, moves):
+        # Add an entry to memory in both orientations
+        for key, key_moves in [
+            (state, moves),
+            (reflect_state(state), moves.translate(REFLECT_MOVES)),
+        ]:
+            self.memory[key] = key_moves
+            self.memory.move_to_end(key)
+        while len(self.memory) > self.capacity:
+            self.memory.popitem(last=False)
+        return
+
+    def moves(self, state):
+        # Optimal blank moves from state to the goal, or None if unknown
+        moves = self.memory.get(state)
+        if moves is not None:
+            self.memory.move_to_end(state)
+            return moves
+        if 2 * self.stored <= self.capacity:
+            return None
+
+        key, reflected = self.canonical(state)
+        row = self.db.execute(
+            "SELECT moves FROM solutions WHERE state = ?",
+            (key.to_bytes(self.key_bytes, "little"),),
+        ).fetchone()
+        if row is None:
+            return None
+        self.remember(key, row[0])
+        if reflected:
+            return row[0].translate(REFLECT_MOVES)
+        return row[0]
+
+    def get(self, state):
+        # Cached optimal solution from state as a list of states
+        moves = self.moves(state)
+        if moves is None:
+            return None
+        return apply_moves(state, moves)
+
+    def put(self, solution):
+        # Save an optimal solution, one entry per state on it
+        moves = path_moves(solution)
+        rows = []
+        for i in range(len(solution) - 1):
+            key, reflected = self.canonical(solution[i])
+            suffix = moves[i:]
+            if reflected:
+                suffix = suffix.translate(REFLECT_MOVES)
+            rows.append((key.to_bytes(self.key_bytes, "little"), suffix))
+            self.remember(key, suffix)
+        with self.db:
+            cursor = self.db.executemany("INSERT OR IGNORE INTO solutions VALUES (?, ?)", rows)
+        self.stored += cursor.rowcount
+        return
+
+
+def get_cache():
+    # Open the solution cache for the current size, None without --cache
+    if not SETTINGS.get("cache"):
+        return None
+    cache = SETTINGS.get("solution_cache")
+    if cache is not None and cache[0] == SETTINGS["size"]:
+        return cache[1]
+
+    SETTINGS["reflect_tables"] = reflect_tables(SETTINGS["size"])
+    cache = SolutionCache(cache_filename(SETTINGS["size"]), SETTINGS["cache_size"])
+    SETTINGS["solution_cache"] = (SETTINGS["size"], cache)
+    return cache
+
+
+def best_first_search(puzzle, solve_state, h_func):
+    # Best First Search will use the heuristic to determine the best
+    # next move to take. It will keep making the best move until it
+    # finds a solution. This is a guaranteed result, but not the shortest
+    # path since it doesn't take steps into account.
+    # Nodes live in a NodePool and are passed around by index.
+    # With --expand-batch, batch_best_first_search does the search.
+    if SETTINGS["expand_batch"] > 1:
+        return batch_best_first_search(puzzle, solve_state, h_func)
+
+    start_state = puzzle
+    # Every state that has been queued, so no state is queued twice
+    seen = {start_state}
+    delta = HEURISTIC_DELTAS.get(h_func)
+    nodes = NodePool()
+    frontier = make_queue()
+    root_h, stats, expand, heuristic = search_hooks(h_func, start_state)
+    if SETTINGS["stats"]:
+        seen = TimedSet(stats, seen)
+        frontier = TimedQueue(frontier, stats)
+
+    # Create the initial node
+    root = nodes.add(start_state, 0, root_h, find_blank(start_state))
+
+    # Create a queue of nodes to visit
+    frontier.push(root_h, root_h, root)
+
+    # While there are still nodes to visit, keep going
+    while len(frontier) > 0:
+        # Get the node with the lowest heuristic value
+        # The f == h for this algorithm.
+        node = frontier.pop()
+        state = nodes.state[node]
+
+        # Check if the node is the solution
+        if state == solve_state:
+            stats.stop()
+            return nodes.path(node)
+
+        # Give up if the time or node limit is used up
+        if stats.limited and stats.over_budget():
+            stats.stop("budget")
+            return None
+
+        # Get the legal moves, except the one back to the parent
+        stats.expanded += 1
+
+        # Create the new nodes, skipping states that were already queued
+        node_h = nodes.h[node]
+        for move in expand(state, nodes.blank[node], nodes.move[node]):
+            stats.generated += 1
+            if move[0] in seen:
+                stats.duplicates += 1
+                continue
+            seen.add(move[0])
+            h = heuristic(h_func, delta, node_h, move)
+            child = nodes.add(move[0], 0, h, move[2], node, move[4])
+            frontier.push(h, h, child)
+
+        if len(frontier) > stats.peak_frontier:
+            stats.peak_frontier = len(frontier)
+
+    stats.stop("exhausted")
+    return None
+
+
+def a_star(puzzle, solve_state, h_func):
+    # A* is uses most of the same code as Best First Search, but it
+    # takes into account the steps taken to get to the current state.
+    # This will guarantee the shortest path to the solution, but might take
+    # longer to find the solution
+    # best_g is the open set index: the lowest g each state was queued with.
+    # Heap entries that were beaten by a lower g later are stale and are
+    # dropped when popped (lazy deletion), as are states already closed.
+    # With --cache, a state with a known optimal suffix gets its exact
+    # distance as h, and when it is popped its suffix finishes the path.
+    # The h check only looks at the states the cache holds in memory, it
+    # runs for every child. The popped state is looked up through the
+    # cache (memory, then the database), since far fewer states are popped.
+    # The other searches only check the cache for the puzzle itself (see
+    # get_solution).
+    # With --expand-batch, batch_a_star does the search.
+    if SETTINGS["expand_batch"] > 1:
+        return batch_a_star(puzzle, solve_state, h_func)
+
+    start_state = puzzle
+    best_g = {start_state: 0}
+    closed = set()
+    delta = HEURISTIC_DELTAS.get(h_func)
+    nodes = NodePool()
+    frontier = make_queue()
+    cache = get_cache()
+    suffixes = cache.memory if cache is not None else None
+    root_h, stats, expand, heuristic = search_hooks(h_func, start_state)
+    if SETTINGS["stats"]:
+        best_g = TimedDict(stats, best_g)
+        closed = TimedSet(stats, closed)
+        frontier = TimedQueue(frontier, stats)
+
+    # Create the initial node
+    root = nodes.add(start_state, 0, root_h, find_blank(start_state))
+
+    # Create a queue of nodes to visit
+    frontier.push(root_h, root_h, root)
+
+    # While there are still nodes to visit, keep going
+    while len(frontier) > 0:
+        # Get the node with the lowest f value (g + h)
+        node = frontier.pop()
+        state = nodes.state[node]
+        node_g = nodes.g[node]
+
+        # Skip stale entries and states that were already expanded
+        if state in closed or node_g > best_g[state]:
+            stats.duplicates += 1
+            continue
+
+        # Check if the node is the solution
+        if state == solve_state:
+            stats.stop()
+            return nodes.path(node)
+
+        # A state with a cached optimal suffix finishes the path, once its
+        # f uses the suffix's length as h. One that was queued with a
+        # smaller h goes back with the exact one, since nodes of a lower f
+        # may still lead to a shorter path.
+        if cache is not None:
+            suffix = cache.moves(state)
+            if suffix is not None and nodes.h[node] == len(suffix):
+                stats.stop()
+                return nodes.path(node) + apply_moves(state, suffix)[1:]
+            if suffix is not None:
+                nodes.h[node] = len(suffix)
+                frontier.push(node_g + len(suffix), len(suffix), node)
+                continue
+
+        # Give up if the time or node limit is used up
+        if stats.limited and stats.over_budget():
+            stats.stop("budget")
+            return None
+
+        # Add the node to the closed set
+        closed.add(state)
+
+        # Get the legal moves, except the one back to the parent
+        stats.expanded += 1
+
+        # Create the new nodes, only if this is the best path to them so far
+        # A closed state reached with a lower g is reopened, which keeps
+        # the result optimal for admissible but inconsistent heuristics
+        g = node_g + 1
+        node_h = nodes.h[node]
+        for move in expand(state, nodes.blank[node], nodes.move[node]):
+            stats.generated += 1
+            child_state = move[0]
+            if best_g.get(child_state, g + 1) <= g:
+                stats.duplicates += 1
+                continue
+            best_g[child_state] = g
+            closed.discard(child_state)
+            h = heuristic(h_func, delta, node_h, move)
+            if suffixes is not None and child_state in suffixes:
+                h = len(suffixes[child_state])
+            child = nodes.add(child_state, g, h, move[2], node, move[4])
+            frontier.push(g + h, h, child)
+
+        if len(frontier) > stats.peak_frontier:
+            stats.peak_frontier = len(frontier)
+
+    stats.stop("exhausted")
+    return None
+
+
+def batch_best_first_search(puzzle, solve_state, h_func):
+    # best_first_search with --expand-batch: the K nodes with the lowest h
+    # are popped and expanded together by expand_batch, and their children
+    # get h from batch_heuristic, so the moves and the heuristic are done
+    # by numpy for the whole batch instead of one child at a time.
+    # Only the seen check is still one child at a time, the new nodes are
+    # added to the pool and the queue in bulk.
+    import numpy as np
+
+    start_state = puzzle
+    seen = {start_state}
+    delta = HEURISTIC_DELTAS.get(h_func)
+    nodes = NodePool()
+    frontier = make_queue()
+    batch_size = SETTINGS["expand_batch"]
+    root_h, stats, expand, heuristic = search_hooks(h_func, start_state, batch=True)
+    if SETTINGS["stats"]:
+        seen = TimedSet(stats, seen)
+        frontier = TimedQueue(frontier, stats)
+
+    root = nodes.add(start_state, 0, root_h, find_blank(start_state))
+    frontier.push(root_h, root_h, root)
+
+    while len(frontier) > 0:
+        # Take up to batch_size nodes, stopping at a goal so that every
+        # node before it is expanded first, like the one at a time search.
+        # The goal and the nodes after it go back in the queue.
+        batch = frontier.pop_many(batch_size)
+        for i in range(len(batch)):
+            if nodes.state[batch[i]] == solve_state:
+                if i == 0:
+                    stats.stop()
+                    return nodes.path(batch[0])
+                rest = batch[i:]
+                h = [nodes.h[node] for node in rest]
+                frontier.push_many(h, h, rest)
+                batch = batch[:i]
+                break
+
+        # Give up if the time or node limit is used up
+        if stats.limited and stats.over_budget():
+            stats.stop("budget")
+            return None
+        stats.expanded += len(batch)
+
+        # Keep the children that were never queued
+        parent, keys, tile, src, dst, code = expand(nodes, batch)
+        stats.generated += len(keys)
+        keep = []
+        for i, key in enumerate(keys):
+            if key not in seen:
+                seen.add(key)
+                keep.append(i)
+        stats.duplicates += len(keys) - len(keep)
+        keep = np.array(keep, dtype=np.intp)
+
+        parent_node = np.array(batch, dtype=np.int64)[parent[keep]]
+        h = heuristic(h_func, delta, nodes, parent_node, keys, keep, tile, src, dst, code)
+        first = nodes.extend(
+            [keys[i] for i in keep],
+            np.zeros(len(keep), dtype=np.int64),
+            h,
+            src[keep],
+            parent_node,
+            code[keep],
+        )
+        h = h.tolist()
+        frontier.push_many(h, h, range(first, first + len(keep)))
+
+        if len(frontier) > stats.peak_frontier:
+            stats.peak_frontier = len(frontier)
+
+    stats.stop("exhausted")
+    return None
+
+
+def batch_a_star(puzzle, solve_state, h_func):
+    # a_star with --expand-batch: the K nodes with the lowest f are popped
+    # and expanded together (see batch_best_first_search).
+    # A node in a batch can be reached again, with a lower g, from a node
+    # earlier in the same batch. a_star already reopens closed states
+    # reached with a lower g, so the path stays optimal. A goal (or, with
+    # --cache, a state with a known suffix) ends the batch and is put back,
+    # so it is only taken once every node with a lower f was expanded.
+    # The cache is used as in a_star: memory only for the children's h,
+    # memory then database for the popped states.
+    import numpy as np
+
+    start_state = puzzle
+    best_g = {start_state: 0}
+    closed = set()
+    delta = HEURISTIC_DELTAS.get(h_func)
+    nodes = NodePool()
+    frontier = make_queue()
+    batch_size = SETTINGS["expand_batch"]
+    cache = get_cache()
+    suffixes = cache.memory if cache is not None else None
+    root_h, stats, expand, heuristic = search_hooks(h_func, start_state, batch=True)
+    if SETTINGS["stats"]:
+        best_g = TimedDict(stats, best_g)
+        closed = TimedSet(stats, closed)
+        frontier = TimedQueue(frontier, stats)
+
+    root = nodes.add(start_state, 0, root_h, find_blank(start_state))
+    frontier.push(root_h, root_h, root)
+
+    while len(frontier) > 0:
+        batch = []
+        popped = frontier.pop_many(batch_size)
+        for i, node in enumerate(popped):
+            state = nodes.state[node]
+
+            # Skip stale entries and states that were already expanded
+            if state in closed or nodes.g[node] > best_g[state]:
+                stats.duplicates += 1
+                continue
+
+            # A goal waits until the nodes before it are expanded, it and
+            # the nodes after it go back in the queue
+            finished = state == solve_state
+            suffix = None
+            if cache is not None and not finished:
+                suffix = cache.moves(state)
+                finished = suffix is not None
+            if suffix is not None and nodes.h[node] != len(suffix):
+                # Not finished until its f uses the exact h, as in a_star
+                nodes.h[node] = len(suffix)
+                frontier.push(nodes.g[node] + len(suffix), len(suffix), node)
+                continue
+            if finished and len(batch) > 0:
+                rest = popped[i:]
+                h = [nodes.h[node] for node in rest]
+                f = [nodes.g[node] + nodes.h[node] for node in rest]
+                frontier.push_many(f, h, rest)
+                break
+            if finished:
+                stats.stop()
+                if state == solve_state:
+                    return nodes.path(node)
+                return nodes.path(node) + apply_moves(state, suffix)[1:]
+
+            closed.add(state)
+            batch.append(node)
+
+        if len(batch) == 0:
+            continue
+
+        # Give up if the time or node limit is used up
+        if stats.limited and stats.over_budget():
+            stats.stop("budget")
+            return None
+        stats.expanded += len(batch)
+
+        # Keep the children on the best path to them so far
+        # A closed state reached with a lower g is reopened
+        parent, keys, tile, src, dst, code = expand(nodes, batch)
+        stats.generated += len(keys)
+        batch_g = np.array([nodes.g[node] for node in batch], dtype=np.int64)
+        keep = []
+        for i, key, child_g in zip(range(len(keys)), keys, (batch_g[parent] + 1).tolist()):
+            if best_g.get(key, child_g + 1) > child_g:
+                best_g[key] = child_g
+                closed.discard(key)
+                keep.append(i)
+        stats.duplicates += len(keys) - len(keep)
+        keep = np.array(keep, dtype=np.intp)
+
+        parent_node = np.array(batch, dtype=np.int64)[parent[keep]]
+        h = heuristic(h_func, delta, nodes, parent_node, keys, keep, tile, src, dst, code)
+        if suffixes is not None:
+            for j, i in enumerate(keep.tolist()):
+                if keys[i] in suffixes:
+                    h[j] = len(suffixes[keys[i]])
+        g = batch_g[parent[keep]] + 1
+        first = nodes.extend([keys[i] for i in keep], g, h, src[keep], parent_node, code[keep])
+        frontier.push_many((g + h).tolist(), h.tolist(), range(first, first + len(keep)))
+
+        if len(frontier) > stats.peak_frontier:
+            stats.peak_frontier = len(frontier)
+
+    stats.stop("exhausted")
+    return None
+
+
+def get_batch_tables():
+    # numpy tables for expand_batch and batch_heuristic, for the current size
+    # neighbors[blank, code]: square the blank moves to, -1 if off the board
+    # heuristics[h_func]: (size, size) cost of each tile on each square,
+    # for the heuristics that are a sum over tiles (misplaced, manhattan,
+    # pnld)
+    import numpy as np
+
+    tables = SETTINGS.get("batch_tables")
+    if tables is not None and tables["size"] == SETTINGS["size"]:
+        return tables
+
+    size = SETTINGS["size"]
+    neighbors = np.full((size, len(MOVES)), -1, dtype=np.intp)
+    for blank, moves in enumerate(SETTINGS["neighbors"]):
+        for target, code, shift in moves:
+            neighbors[blank, code] = target
+    heuristics = {}
+    for h_func, name in [
+        (h1_misplaced, "misplaced_table"),
+        (h2_manhattan, "manhattan_table"),
+        (h3_pnld, "pnld_table"),
+    ]:
+        heuristics[h_func] = np.array(SETTINGS[name], dtype=np.int64).reshape(size, size)
+    tables = {"size": size, "neighbors": neighbors, "heuristics": heuristics}
+    SETTINGS["batch_tables"] = tables
+    return tables
+
+
+def unpack_boards(states):
+    # Packed states to a (K, size) uint8 array of tiles, one row per state
+    # The states are cut into uint64 words of whole tiles (all of a 4x4
+    # board fits one word), then numpy cuts the tiles out of the words.
+    import numpy as np
+
+    size = SETTINGS["size"]
+    bits = SETTINGS["tile_bits"]
+    per_word = 64 // bits
+    words = (size + per_word - 1) // per_word
+    if words == 1:
+        data = np.array(states, dtype=np.uint64)[:, None]
+    else:
+        width = per_word * bits
+        mask = (1 << width) - 1
+        data = np.array(
+            [[(state >> (j * width)) & mask for j in range(words)] for state in states],
+            dtype=np.uint64,
+        ).reshape(len(states), words)
+    squares = np.arange(size)
+    shifts = (squares % per_word * bits).astype(np.uint64)
+    fields = (data[:, squares // per_word] >> shifts) & np.uint64(SETTINGS["tile_mask"])
+    return fields.astype(np.uint8)
+
+
+def pack_boards(boards):
+    # Inverse of unpack_boards, a list of packed states (Python ints)
+    import numpy as np
+
+    count, size = boards.shape
+    bits = SETTINGS["tile_bits"]
+    per_word = 64 // bits
+    shifts = (np.arange(per_word) * bits).astype(np.uint64)
+    keys = None
+    for j in range(0, size, per_word):
+        part = boards[:, j : j + per_word].astype(np.uint64)
+        # The fields do not overlap, so the sum is the same as or-ing them
+        word = (part << shifts[: part.shape[1]]).sum(axis=1).tolist()
+        if keys is None:
+            keys = word
+        else:
+            keys = [key | (value << (j * bits)) for key, value in zip(keys, word)]
+    return keys
+
+
+def expand_batch(nodes, batch):
+    # Children of every node in batch (indices into nodes) at once
+    # The boards are stacked into a (K, size) array, every legal move of
+    # every board (except the one back to its parent) is picked from the
+    # neighbor table, and the children are made with fancy indexing.
+    # Returns (parent, states, tile, src, dst, code), one entry per child
+    # like successors: parent is the position in batch, states is a list
+    # of packed children and the rest are arrays. The children are in the
+    # order one at a time expansion makes them.
+    import numpy as np
+
+    tables = get_batch_tables()
+    boards = unpack_boards([nodes.state[node] for node in batch])
+    blank = np.array([nodes.blank[node] for node in batch], dtype=np.intp)
+    last = np.array([nodes.move[node] for node in batch], dtype=np.intp)
+    targets = tables["neighbors"][blank]
+    codes = np.arange(len(MOVES))
+    # last is -1 at the root, and -1 ^ 1 is no move's code
+    legal = (targets >= 0) & (codes[None, :] != (last ^ 1)[:, None])
+    parent, code = np.nonzero(legal)
+    src = targets[parent, code]
+    dst = blank[parent]
+    children = boards[parent]
+    rows = np.arange(len(parent))
+    tile = children[rows, src]
+    children[rows, dst] = tile
+    children[rows, src] = 0
+    return parent, pack_boards(children), tile, src, dst, code
+
+
+def batch_heuristic(h_func, delta, nodes, parent_node, states, keep, tile, src, dst, code):
+    # h of the children from expand_batch that are kept, an int64 array
+    # Misplaced, manhattan and pnld are a sum over tiles, so a child's h is
+    # its parent's plus the moved tile's change, read from the table for
+    # every child in one numpy pass. The other heuristics go through
+    # child_heuristic one child at a time. With debug on, the table result
+    # is checked against the whole board sums.
+    import numpy as np
+
+    table = get_batch_tables()["heuristics"].get(h_func)
+    parent_h = np.array([nodes.h[node] for node in parent_node.tolist()], dtype=np.int64)
+    if table is None:
+        h = []
+        for j, i in enumerate(keep.tolist()):
+            move = (states[i], int(tile[i]), int(src[i]), int(dst[i]), int(code[i]))
+            h.append(child_heuristic(h_func, delta, int(parent_h[j]), move))
+        return np.array(h, dtype=np.int64)
+
+    moved = tile[keep].astype(np.intp)
+    h = parent_h + table[moved, dst[keep]] - table[moved, src[keep]]
+    if SETTINGS["debug"] and len(keep) > 0:
+        boards = unpack_boards([states[i] for i in keep])
+        full = table[boards, np.arange(SETTINGS["size"])].sum(axis=1)
+        if not np.array_equal(full, h):
+            raise ValueError(f"Heuristic mismatch: {h_func.__name__} batch delta")
+    return h
+
+
+def ida_star(puzzle, solve_state, h_func):
+    # Iterative Deepening A* runs a depth first search bounded by f = g + h.
+    # When a pass fails, the bound grows to the smallest f that went over it.
+    # Only the current path is kept, so memory is linear in the solution
+    # depth, and the first solution found is optimal like a_star.
+    # The move that undoes the parent's move is never generated, and the
+    # blank's position is passed down instead of searched for.
+    # With --tt-size, a bounded transposition table skips states already
+    # reached at a lower or equal g during the same pass.
+
+    delta = HEURISTIC_DELTAS.get(h_func)
+    tt_size = SETTINGS["tt_size"]
+    path = [puzzle]
+    table = {}
+    root_h, stats, expand, heuristic = search_hooks(h_func, puzzle)
+    if SETTINGS["stats"]:
+        table = TimedDict(stats)
+
+    def search(g, h, bound, blank, last):
+        # Returns True when the goal is found (path holds the solution)
+        # Otherwise returns the smallest f over the bound, None if no children
+        state = path[-1]
+        f = g + h
+        if f > bound:
+            return f
+        if state == solve_state:
+            return True
+
+        if tt_size > 0:
+            if table.get(state, g + 1) <= g:
+                stats.duplicates += 1
+                return None
+            if len(table) < tt_size or state in table:
+                table[state] = g
+
+        if len(path) > stats.peak_frontier:
+            stats.peak_frontier = len(path)
+        if stats.limited and stats.over_budget():
+            raise BudgetExceeded()
+        stats.expanded += 1
+        next_bound = None
+        for move in expand(state, blank, last):
+            stats.generated += 1
+            child_h = heuristic(h_func, delta, h, move)
+            path.append(move[0])
+            result = search(g + 1, child_h, bound, move[2], move[4])
+            if result is True:
+                return True
+            path.pop()
+            if result is not None and (next_bound is None or result < next_bound):
+                next_bound = result
+        return next_bound
+
+    bound = root_h
+    while True:
+        verbose(f"IDA* bound: {bound}\n")
+        table.clear()
+        try:
+            result = search(0, root_h, bound, find_blank(puzzle), -1)
+        except BudgetExceeded:
+            stats.stop("budget")
+            return None
+        if result is True:
+            stats.stop()
+            return path
+        if result is None:
+            stats.stop("exhausted")
+            return None
+        bound = result
+
+
+def perfect_search(puzzle, solve_state, h_func):
+    # Perfect Distance Table lookup
+    # Every state's exact distance to the goal is known, so an optimal
+    # path is found by always moving to a neighbor one step closer.
+    # No search is needed and the heuristic is not used.
+
+    table = get_perfect()["map"]
+    state = puzzle
+    stats = new_stats()
+    distance = table[permutation_rank(state)]
+    if distance == 255:
+        stats.stop("exhausted")
+        return None
+
+    solution = [state]
+    while distance > 0:
+        moves = legal_moves(state)
+        stats.expanded += 1
+        stats.generated += len(moves)
+        for move in moves:
+            if table[permutation_rank(move[0])] == distance - 1:
+                state = move[0]
+                break
+        distance -= 1
+        solution.append(state)
+
+    stats.peak_frontier = 1
+    stats.stop()
+    return solution
+
+
+def bidirectional_mm(puzzle, solve_state, h_func):
+    # Bidirectional A* (MM, Holte et al. 2016)
+    # One search goes forward from the puzzle to the goal, the other goes
+    # backward from the goal to the puzzle with a heuristic toward the
+    # puzzle. Both expand in order of pr = max(f, 2g), so neither side goes
+    # much past the middle of the optimal path.
+    # When a child is already known to the other side the paths meet, and
+    # best_cost is the cheapest meeting so far. It is optimal once it is no
+    # more than the bound on any path still to be found: the lowest pr or f
+    # left on either side, or the lowest g of both sides plus one step.
+
+    back_h, back_delta = target_heuristic(h_func, puzzle)
+    # The backward h may build tables of its own, keep it out of the timings
+    back_root_h = back_h(solve_state)
+    root_h, stats, expand, heuristic = search_hooks(h_func, puzzle)
+    root_h = [root_h, back_root_h]
+
+    # Each side has its own nodes, frontier and state -> best node index
+    # A node whose state maps to a newer node is stale and skipped
+    # f_heap and g_heap track the lowest f and g still open for the bound
+    sides = []
+    for start, h, h_delta, name in [
+        (puzzle, h_func, HEURISTIC_DELTAS.get(h_func), "forward"),
+        (solve_state, back_h, back_delta, "backward"),
+    ]:
+        nodes = NodePool()
+        frontier = make_queue()
+        found = {}
+        if SETTINGS["stats"]:
+            frontier = TimedQueue(frontier, stats)
+            found = TimedDict(stats, found)
+        root = nodes.add(start, 0, root_h[len(sides)], find_blank(start))
+        found[start] = root
+        frontier.push(root_h[len(sides)], root_h[len(sides)], root)
+        sides.append(
+            {
+                "name": name,
+                "nodes": nodes,
+                "frontier": frontier,
+                "found": found,
+                "closed": set(),
+                "f_heap": [(root_h[len(sides)], root)],
+                "g_heap": [(0, root)],
+                "h": h,
+                "delta": h_delta,
+            }
+        )
+        stats.per_direction[name] = 0
+
+    def lowest_open(side, heap):
+        # Drop expanded and stale nodes from the top, then return the lowest
+        nodes = side["nodes"]
+        while len(heap) > 0:
+            node = heap[0][1]
+            if node not in side["closed"] and side["found"][nodes.state[node]] == node:
+                return heap[0][0]
+            heapq.heappop(heap)
+        return 0
+
+    best_cost = None
+    best_nodes = None
+    if puzzle == solve_state:
+        best_cost, best_nodes = 0, (0, 0)
+
+    forward, backward = sides
+    while len(forward["frontier"]) > 0 and len(backward["frontier"]) > 0:
+        # Stop once no unexpanded node can lead to a cheaper meeting
+        low = [forward["frontier"].min_key(), backward["frontier"].min_key()]
+        if best_cost is not None:
+            bound = max(
+                min(low),
+                lowest_open(forward, forward["f_heap"]),
+                lowest_open(backward, backward["f_heap"]),
+                lowest_open(forward, forward["g_heap"])
+                + lowest_open(backward, backward["g_heap"])
+                + 1,
+            )
+            if best_cost <= bound:
+                break
+
+        # Expand the side with the lower pr, forward on ties
+        if low[0] <= low[1]:
+            side, other = forward, backward
+        else:
+            side, other = backward, forward
+        nodes = side["nodes"]
+        found = side["found"]
+        node = side["frontier"].pop()
+        state = nodes.state[node]
+        if found[state] != node:
+            stats.duplicates += 1
+            continue
+
+        # Give up if the time or node limit is used up
+        if stats.limited and stats.over_budget():
+            stats.stop("budget")
+            return None
+
+        side["closed"].add(node)
+        stats.expanded += 1
+        stats.per_direction[side["name"]] += 1
+
+        g = nodes.g[node] + 1
+        node_h = nodes.h[node]
+        for move in expand(state, nodes.blank[node], nodes.move[node]):
+            stats.generated += 1
+            child_state = move[0]
+            old = found.get(child_state)
+            if old is not None and nodes.g[old] <= g:
+                stats.duplicates += 1
+                continue
+            h = heuristic(side["h"], side["delta"], node_h, move)
+            child = nodes.add(child_state, g, h, move[2], node, move[4])
+            found[child_state] = child
+            side["frontier"].push(max(g + h, 2 * g), h, child)
+            heapq.heappush(side["f_heap"], (g + h, child))
+            heapq.heappush(side["g_heap"], (g, child))
+
+            # Check if the other side already reached this state
+            meet = other["found"].get(child_state)
+            if meet is not None:
+                cost = g + other["nodes"].g[meet]
+                if best_cost is None or cost < best_cost:
+                    best_cost = cost
+                    if side is forward:
+                        best_nodes = (child, meet)
+                    else:
+                        best_nodes = (meet, child)
+
+        frontier_size = len(forward["frontier"]) + len(backward["frontier"])
+        if frontier_size > stats.peak_frontier:
+            stats.peak_frontier = frontier_size
+
+    if best_cost is None:
+        stats.stop("exhausted")
+        return None
+
+    # Forward path to the meeting state, then the backward path reversed
+    stats.stop()
+    path = forward["nodes"].path(best_nodes[0])
+    back = backward["nodes"].path(best_nodes[1])
+    back.reverse()
+    return path + back[1:]
+
+
+def ara_star(puzzle, solve_state, h_func):
+    # Anytime Repairing A* (ARA*, Likhachev et al. 2003)
+    # Runs weighted A* (f = g + w * h) with a high weight to find a path
+    # fast, then lowers the weight and keeps improving it. Each pass reuses
+    # the g values found so far: only states whose g went down since they
+    # were expanded (the inconsistent ones) are looked at again.
+    # Every better path is printed with a bound on how far it can be from
+    # optimal. With --time-limit or --node-limit the best path found so far
+    # is returned when the budget runs out.
+
+    start_state = puzzle
+    weight = SETTINGS["weight"]
+    delta = HEURISTIC_DELTAS.get(h_func)
+    nodes = NodePool()
+    found = {}
+    closed = set()
+    root_h, stats, expand, heuristic = search_hooks(h_func, start_state)
+    if SETTINGS["stats"]:
+        found = TimedDict(stats, found)
+        closed = TimedSet(stats, closed)
+
+    def new_frontier(open_nodes):
+        # The keys depend on the weight, so each pass gets a new frontier
+        frontier = HeapQueue(SETTINGS["tie_break"])
+        if SETTINGS["stats"]:
+            frontier = TimedQueue(frontier, stats)
+        for node in open_nodes:
+            frontier.push(nodes.g[node] + weight * nodes.h[node], nodes.h[node], node)
+        return frontier
+
+    # found maps each state to the node with its lowest g
+    # A node whose state maps to a newer node is stale and skipped
+    root = nodes.add(start_state, 0, root_h, find_blank(start_state))
+    found[start_state] = root
+    frontier = new_frontier([root])
+    inconsistent = []
+    best = None
+
+    while True:
+        # Expand until no open node can improve the path to the goal
+        while len(frontier) > 0:
+            goal = found.get(solve_state)
+            if goal is not None and nodes.g[goal] <= frontier.min_key():
+                break
+            node = frontier.pop()
+            state = nodes.state[node]
+            if state in closed or found[state] != node:
+                stats.duplicates += 1
+                continue
+
+            # Give up if the time or node limit is used up
+            if stats.limited and stats.over_budget():
+                stats.stop("budget")
+                return best
+
+            closed.add(state)
+            stats.expanded += 1
+
+            g = nodes.g[node] + 1
+            node_h = nodes.h[node]
+            for move in expand(state, nodes.blank[node], nodes.move[node]):
+                stats.generated += 1
+                child_state = move[0]
+                old = found.get(child_state)
+                if old is not None and nodes.g[old] <= g:
+                    stats.duplicates += 1
+                    continue
+                h = heuristic(h_func, delta, node_h, move)
+                child = nodes.add(child_state, g, h, move[2], node, move[4])
+                found[child_state] = child
+                # Closed states wait for the next pass instead of reopening
+                if child_state in closed:
+                    inconsistent.append(child)
+                else:
+                    frontier.push(g + weight * h, h, child)
+
+            if len(frontier) > stats.peak_frontier:
+                stats.peak_frontier = len(frontier)
+
+        goal = found.get(solve_state)
+        if goal is None:
+            stats.stop("exhausted")
+            return None
+
+        # Everything still open or inconsistent, for the bound and next pass
+        open_nodes = []
+        for node in frontier.items():
+            state = nodes.state[node]
+            if found[state] == node and state not in closed:
+                open_nodes.append(node)
+        for node in inconsistent:
+            if found[nodes.state[node]] == node:
+                open_nodes.append(node)
+        open_nodes = list(dict.fromkeys(open_nodes))
+
+        # The optimal cost is at least the lowest g + h still open
+        cost = nodes.g[goal]
+        lowest = min([nodes.g[n] + nodes.h[n] for n in open_nodes], default=cost)
+        bound = max(1.0, min(weight, cost / lowest)) if lowest > 0 else 1.0
+        # Steps are counted like everywhere else, as states on the path
+        if best is None or cost < len(best) - 1 or bound < stats.bound:
+            best = nodes.path(goal)
+            stats.bound = bound
+            if SETTINGS["progress"]:
+                perror(f"Solution: {len(best)} steps, within {bound:.2f}x of optimal\n")
+
+        if bound <= 1.0 or weight <= 1.0:
+            stats.bound = 1.0
+            stats.stop()
+            return best
+
+        # Lower the weight and carry on from the open and inconsistent nodes
+        weight = max(1.0, weight - SETTINGS["weight_step"])
+        closed.clear()
+        inconsistent = []
+        frontier = new_frontier(open_nodes)
+
+
+def hda_star(puzzle, solve_state, h_func):
+    # Hash Distributed A* (HDA*, Kishimoto et al. 2009)
+    # Every state is owned by one of --search-workers processes, picked by
+    # state_owner. Each worker runs A* on the states it owns and sends the
+    # children it generates to their owners in batches (hda_worker).
+    # The first path to the goal gives an incumbent cost, and workers only
+    # expand nodes with f below it. The incumbent is optimal once every
+    # worker is idle and no batch is on its way: two looks at the message
+    # counts in a row must agree (Mattern's four counter method).
+    # The path is then rebuilt by asking each state's owner for its parent.
+    import multiprocessing
+
+    workers = SETTINGS["search_workers"]
+    # The first h runs before the workers start, so forked workers share
+    # any tables it builds
+    root_h, stats = search_hooks(h_func, puzzle)[:2]
+    if puzzle == solve_state:
+        stats.stop()
+        return [puzzle]
+
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+    inboxes = [context.Queue() for _ in range(workers)]
+    replies = context.Queue()
+    # Each worker only writes its own slot of the arrays, so no locks
+    incumbent = context.Value("q", HDA_NO_COST, lock=False)
+    shared = (
+        incumbent,
+        context.Lock(),
+        context.Array("q", workers, lock=False),  # batches sent
+        context.Array("q", workers, lock=False),  # batches received
+        context.Array("q", workers, lock=False),  # nodes expanded
+        context.Array("b", workers, lock=False),  # 1 when out of work
+    )
+    sent, received, expanded, idle = shared[2:]
+    options = {key: SETTINGS[key] for key in WORKER_SETTINGS}
+    setup = (options, SETTINGS["size"], h_func.__name__, puzzle, solve_state, root_h)
+    processes = [
+        context.Process(
+            target=hda_worker,
+            args=(index, workers, inboxes, replies, shared, setup),
+            daemon=True,
+        )
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    # Wait until the search is done, out of budget or a worker died
+    status = None
+    previous = None
+    while status is None:
+        time.sleep(HDA_POLL)
+        stats.expanded = sum(expanded)
+        if stats.limited and stats.over_budget():
+            status = "budget"
+        elif not all(process.is_alive() for process in processes):
+            for process in processes:
+                process.terminate()
+            raise RuntimeError("HDA* worker stopped unexpectedly")
+        elif all(idle):
+            # received is read before sent, and neither may change between
+            # two looks, so no batch was in flight or handled in between
+            counts = (sum(received), sum(sent))
+            if counts[0] == counts[1] and counts == previous:
+                status = "solved" if incumbent.value < HDA_NO_COST else "exhausted"
+            previous = counts
+        else:
+            previous = None
+
+    # Follow the parents back from the goal
+    path = None
+    if status == "solved":
+        path = [solve_state]
+        while True:
+            inboxes[state_owner(path[-1], workers)].put(("parent", path[-1]))
+            parent = replies.get()
+            if parent < 0:
+                break
+            path.append(parent)
+        path.reverse()
+
+    for inbox in inboxes:
+        inbox.put(("stop",))
+    for _ in range(workers):
+        index, worker_expanded, generated, duplicates, peak = replies.get()
+        stats.per_direction[f"worker{index}"] = worker_expanded
+        stats.generated += generated
+        stats.duplicates += duplicates
+        stats.peak_frontier += peak
+    for process in processes:
+        process.join()
+    stats.expanded = sum(stats.per_direction.values())
+    stats.stop(status)
+    return path
+
+
+# HDA* incumbent before any path is found, seconds between termination
+# checks, and nodes a worker expands between looks at its inbox
+HDA_NO_COST = 1 << 62
+HDA_POLL = 0.002
+HDA_CHUNK = 64
+
+# Multiplier for state_owner (2^64 / golden ratio)
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+def state_owner(state, workers):
+    # HDA* worker that owns a packed state
+    # A multiplicative hash spreads neighboring states over the workers,
+    # the packed value itself would give the same owner to whole regions
+    return (((hash(state) * HASH_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) >> 32) % workers
+
+
+def hda_worker(index, workers, inboxes, replies, shared, setup):
+    # One HDA* worker process, see hda_star
+    # Messages in the inbox: ("nodes", batch) with 6 fields per child
+    # (state, g, h, parent state, blank, move), ("parent", state) to look up
+    # a parent for the path and ("stop",) to report the metrics and quit
+    incumbent, lock, sent, received, expanded, idle = shared
+    options, size, h_name, puzzle, solve_state, root_h = setup
+    init_search_worker(options, size, None)
+    h_func = globals()[h_name]
+    delta = HEURISTIC_DELTAS.get(h_func)
+    inbox = inboxes[index]
+    nodes = NodePool()
+    frontier = make_queue()
+    best_g = {}
+    parents = {}
+    outboxes = [[] for _ in range(workers)]
+    counts = {"expanded": 0, "generated": 0, "duplicates": 0, "peak": 0}
+
+    def add(state, g, h, parent, blank, move):
+        # Queue a state this worker owns, if this is its lowest g so far
+        if best_g.get(state, g + 1) <= g:
+            counts["duplicates"] += 1
+            return
+        best_g[state] = g
+        parents[state] = parent
+        if state == solve_state:
+            with lock:
+                if g < incumbent.value:
+                    incumbent.value = g
+        elif g + h < incumbent.value:
+            frontier.push(g + h, h, nodes.add(state, g, h, blank, -1, move))
+
+    if state_owner(puzzle, workers) == index:
+        add(puzzle, 0, root_h, -1, find_blank(puzzle), -1)
+
+    while True:
+        # Handle every message that arrived, wait for one when idle
+        try:
+            if idle[index]:
+                message = inbox.get(timeout=HDA_POLL)
+            else:
+                message = inbox.get_nowait()
+        except queue.Empty:
+            message = None
+        while message is not None:
+            idle[index] = 0
+            if message[0] == "nodes":
+                batch = message[1]
+                for i in range(0, len(batch), 6):
+                    add(*batch[i : i + 6])
+                received[index] += 1
+            elif message[0] == "parent":
+                replies.put(parents[message[1]])
+            else:
+                # Batches to workers that already quit are dropped
+                for other in inboxes:
+                    other.cancel_join_thread()
+                replies.put(
+                    (
+                        index,
+                        counts["expanded"],
+                        counts["generated"],
+                        counts["duplicates"],
+                        counts["peak"],
+                    )
+                )
+                return
+            try:
+                message = inbox.get_nowait()
+            except queue.Empty:
+                message = None
+
+        # Expand a few nodes that could still beat the incumbent
+        for _ in range(HDA_CHUNK):
+            if len(frontier) == 0 or frontier.min_key() >= incumbent.value:
+                break
+            node = frontier.pop()
+            state = nodes.state[node]
+            g = nodes.g[node]
+            if g > best_g[state]:
+                counts["duplicates"] += 1
+                continue
+            counts["expanded"] += 1
+            node_h = nodes.h[node]
+            for move in successors(state, nodes.blank[node], nodes.move[node]):
+                counts["generated"] += 1
+                h = child_heuristic(h_func, delta, node_h, move)
+                owner = state_owner(move[0], workers)
+                if owner == index:
+                    add(move[0], g + 1, h, state, move[2], move[4])
+                else:
+                    outboxes[owner].extend((move[0], g + 1, h, state, move[2], move[4]))
+        expanded[index] = counts["expanded"]
+        if len(frontier) > counts["peak"]:
+            counts["peak"] = len(frontier)
+
+        # Send the children to their owners, sent is counted before the
+        # batch goes out so the counts never show it as delivered early
+        for owner in range(workers):
+            if len(outboxes[owner]) > 0:
+                sent[index] += 1
+                inboxes[owner].put(("nodes", outboxes[owner]))
+                outboxes[owner] = []
+        if len(frontier) == 0 or frontier.min_key() >= incumbent.value:
+            idle[index] = 1
+
+
+def parallel_ida_star(puzzle, solve_state, h_func):
+    # Parallel IDA* by splitting the tree at the root
+    # The tree is expanded breadth first to PIDA_DEPTH moves (never undoing
+    # the last move), and every node at that depth becomes the root of one
+    # subtree. For each bound, the subtrees are searched by a pool of
+    # --search-workers processes (ida_subtree), and the next bound is the
+    # smallest f over it from any subtree. Every path found at a bound
+    # costs exactly the bound, which is the lowest one with a path, so the
+    # first worker to find one has an optimal path and the others are
+    # told to stop through a shared event.
+    # Memory stays linear in the depth, like ida_star (no --tt-size here).
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    workers = SETTINGS["search_workers"]
+    delta = HEURISTIC_DELTAS.get(h_func)
+    # The first h runs before the workers start, so forked workers share
+    # any tables it builds
+    root_h, stats, expand, heuristic = search_hooks(h_func, puzzle)
+
+    # Split the tree, each entry is (path, g, h, blank, last move)
+    # A goal found here is at the lowest depth it can be, so it is optimal
+    subtrees = [([puzzle], 0, root_h, find_blank(puzzle), -1)]
+    for depth in range(PIDA_DEPTH + 1):
+        for path, g, h, blank, last in subtrees:
+            if path[-1] == solve_state:
+                stats.peak_frontier = len(path)
+                stats.stop()
+                return path
+        if depth == PIDA_DEPTH:
+            break
+        children = []
+        for path, g, h, blank, last in subtrees:
+            stats.expanded += 1
+            for move in expand(path[-1], blank, last):
+                stats.generated += 1
+                child_h = heuristic(h_func, delta, h, move)
+                children.append((path + [move[0]], g + 1, child_h, move[2], move[4]))
+        if len(children) == 0:
+            stats.stop("exhausted")
+            return None
+        subtrees = children
+    # Subtrees that look closest to the goal go first
+    subtrees.sort(key=lambda subtree: (subtree[1] + subtree[2], subtree[2]))
+
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+    stop = context.Event()
+    options = {key: SETTINGS[key] for key in WORKER_SETTINGS}
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=init_search_worker,
+        initargs=(options, SETTINGS["size"], stop),
+    )
+    # No path costs less than the lowest f of the subtrees
+    bound = min(g + h for path, g, h, blank, last in subtrees)
+    solution = None
+    status = None
+    with pool:
+        while status is None:
+            verbose(f"Parallel IDA* bound: {bound}\n")
+            stop.clear()
+            # Workers get the time left as a wall clock deadline
+            deadline = None
+            if stats.time_limit > 0:
+                left = stats.time_limit - (time.perf_counter() - stats.start)
+                deadline = time.time() + left
+            futures = {}
+            for path, g, h, blank, last in subtrees:
+                task = (path[-1], g, h, blank, last, bound, h_func.__name__, deadline)
+                futures[pool.submit(ida_subtree, *task)] = path
+
+            next_bound = None
+            for future in as_completed(futures):
+                suffix, over, expanded, generated, depth = future.result()
+                stats.expanded += expanded
+                stats.generated += generated
+                depth += len(futures[future]) - 1
+                if depth > stats.peak_frontier:
+                    stats.peak_frontier = depth
+                if suffix is not None and solution is None:
+                    solution = futures[future] + suffix[1:]
+                    stop.set()
+                elif suffix is None and over is not None:
+                    if next_bound is None or over < next_bound:
+                        next_bound = over
+                if stats.limited and stats.over_budget() and solution is None:
+                    stop.set()
+                    status = "budget"
+
+            if solution is not None:
+                status = "solved"
+            elif status is None and next_bound is None:
+                status = "exhausted"
+            bound = next_bound
+
+    stats.stop(status)
+    return solution
+
+
+# Depth of the parallel IDA* split, and nodes a worker expands between
+# checks of the stop event and deadline
+PIDA_DEPTH = 8
+PIDA_CHECK = 1024
+
+
+def init_search_worker(options, size, stop):
+    # Runs once in every parallel search worker process
+    # Forked workers already have the settings and tables of the parent
+    if SETTINGS.get("size") != size:
+        SETTINGS.update(options)
+        set_size(size)
+    SETTINGS["stop_event"] = stop
+    return
+
+
+def ida_subtree(state, g, h, blank, last, bound, h_name, deadline):
+    # Bounded depth first search of one parallel IDA* subtree
+    # Returns (path, next bound, expanded, generated, deepest path):
+    # path runs from state to the goal, or is None when there is none
+    # within bound (next bound is then the smallest f over it, None if
+    # nothing went over) or when the stop event or deadline cut it short
+    h_func = globals()[h_name]
+    delta = HEURISTIC_DELTAS.get(h_func)
+    solve_state = SETTINGS["solve_key"]
+    stop = SETTINGS["stop_event"]
+    path = [state]
+    counts = {"expanded": 0, "generated": 0, "depth": 0}
+    if stop.is_set():
+        return None, None, 0, 0, 0
+
+    def search(g, h, blank, last):
+        # Same as the search in ida_star, without the transposition table
+        f = g + h
+        if f > bound:
+            return f
+        if path[-1] == solve_state:
+            return True
+        if len(path) > counts["depth"]:
+            counts["depth"] = len(path)
+        counts["expanded"] += 1
+        if counts["expanded"] % PIDA_CHECK == 0:
+            if stop.is_set() or (deadline is not None and time.time() >= deadline):
+                raise BudgetExceeded()
+        next_bound = None
+        for move in successors(path[-1], blank, last):
+            counts["generated"] += 1
+            child_h = child_heuristic(h_func, delta, h, move)
+            path.append(move[0])
+            result = search(g + 1, child_h, move[2], move[4])
+            if result is True:
+                return True
+            path.pop()
+            if result is not None and (next_bound is None or result < next_bound):
+                next_bound = result
+        return next_bound
+
+    try:
+        result = search(g, h, blank, last)
+    except BudgetExceeded:
+        return None, None, counts["expanded"], counts["generated"], counts["depth"]
+    if result is True:
+        return path, None, counts["expanded"], counts["generated"], counts["depth"]
+    return None, result, counts["expanded"], counts["generated"], counts["depth"]
+
+
+def external_a_star(puzzle, solve_state, h_func):
+    # External memory A* (Edelkamp, Jabbar and Schroedl 2004)
+    # Nodes are kept on disk in buckets by (g, h), and the buckets are
+    # expanded in order of f = g + h (lowest h first among equal f).
+    # New children only go to in-memory buffers of --external-buffer
+    # states. A full buffer is sorted and written out as a run file.
+    # Duplicates are removed late (delayed duplicate detection): just
+    # before a bucket is expanded, its runs are merged into one sorted
+    # layer file. The merge drops states repeated in the bucket and states
+    # already in the (g - 2, h) layer. Every move changes the colour of the
+    # blank's square, so a state can not come back one move later, and
+    # with a consistent heuristic every earlier copy is two moves back.
+    # With an inconsistent one a state may be expanded again at a higher
+    # g. That wastes work, but the path is still optimal.
+    # Expanding streams through the layer file with a memory map. Each
+    # state is stored with the move that made it, so the path is followed
+    # back by looking every parent up in its layer (binary search).
+
+    delta = HEURISTIC_DELTAS.get(h_func)
+    width = external_width()
+    limit = SETTINGS["external_buffer"]
+    root_h, stats, expand, heuristic = search_hooks(h_func, puzzle)
+    directory = tempfile.mkdtemp(prefix="external_", dir=SETTINGS["external_dir"])
+    verbose(f"External search files: {directory}\n")
+
+    buffers = {(0, root_h): [puzzle << 3]}  # (g, h) -> keys still in memory
+    runs = {}  # (g, h) -> sorted run files not merged yet
+    layers = {}  # (g, h) -> merged layer files, sorted and without repeats
+    counts = {"buffered": 1, "pending": 1, "files": 0}
+
+    def flush():
+        # Write every buffer out as a sorted run
+        for bucket, keys in buffers.items():
+            keys.sort()
+            filename = os.path.join(directory, f"run_{counts['files']}.bin")
+            counts["files"] += 1
+            write_keys(filename, keys, width)
+            runs.setdefault(bucket, []).append(filename)
+        buffers.clear()
+        counts["buffered"] = 0
+
+    try:
+        while len(buffers) > 0 or len(runs) > 0:
+            pending = set(buffers) | set(runs)
+            g, h = min(pending, key=lambda bucket: (bucket[0] + bucket[1], bucket[1]))
+            if (g, h) in buffers:
+                keys = buffers.pop((g, h))
+                counts["buffered"] -= len(keys)
+                keys.sort()
+                filename = os.path.join(directory, f"run_{counts['files']}.bin")
+                counts["files"] += 1
+                write_keys(filename, keys, width)
+                runs.setdefault((g, h), []).append(filename)
+
+            # Merge the runs into a new layer, without the states seen before
+            bucket_runs = runs.pop((g, h))
+            older = layers.get((g - 2, h), []) + layers.get((g, h), [])
+            layer = os.path.join(directory, f"layer_{g}_{h}_{counts['files']}.bin")
+            counts["files"] += 1
+            written, dropped = merge_runs(bucket_runs, older, layer, width)
+            for filename in bucket_runs:
+                counts["pending"] -= os.path.getsize(filename) // width
+                os.remove(filename)
+            stats.duplicates += dropped
+            if written == 0:
+                os.remove(layer)
+                continue
+            layers.setdefault((g, h), []).append(layer)
+
+            # This is the lowest f left, so a goal here is optimal
+            if h == 0 and find_key(layer, solve_state, width) is not None:
+                stats.stop()
+                return external_path(layers, g, solve_state, h_func, width)
+
+            for key in read_keys(layer, width):
+                # Give up if the time or node limit is used up
+                if stats.limited and stats.over_budget():
+                    stats.stop("budget")
+                    return None
+                state = key >> 3
+                stats.expanded += 1
+                for move in expand(state, find_blank(state), (key & 7) - 1):
+                    stats.generated += 1
+                    child_h = heuristic(h_func, delta, h, move)
+                    child_key = move[0] << 3 | (move[4] + 1)
+                    buffers.setdefault((g + 1, child_h), []).append(child_key)
+                    counts["buffered"] += 1
+                    counts["pending"] += 1
+                if counts["buffered"] >= limit:
+                    flush()
+                if counts["pending"] > stats.peak_frontier:
+                    stats.peak_frontier = counts["pending"]
+
+        stats.stop("exhausted")
+        return None
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+# States written to a file at a time by the external search
+EXTERNAL_WRITE = 65536
+
+
+def external_width():
+    # Bytes per key in the external search files: the packed state and 3
+    # bits for the move that made it (0 for the root, else code + 1)
+    # Keys are stored big endian, so the files sort like the numbers
+    return (SETTINGS["size"] * SETTINGS["tile_bits"] + 3 + 7) // 8
+
+
+def write_keys(filename, keys, width):
+    # Write keys (already sorted) to a file, width bytes each
+    with open(filename, "wb") as f:
+        for start in range(0, len(keys), EXTERNAL_WRITE):
+            chunk = keys[start : start + EXTERNAL_WRITE]
+            f.write(b"".join(key.to_bytes(width, "big") for key in chunk))
+    return
+
+
+def read_keys(filename, width):
+    # Yield the keys of a file in order, read through a memory map
+    size = os.path.getsize(filename)
+    if size == 0:
+        return
+    with open(filename, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for offset in range(0, size, width):
+                yield int.from_bytes(data[offset : offset + width], "big")
+
+
+def merge_runs(runs, older, filename, width):
+    # Merge sorted run files into one sorted file holding each state once
+    # States that are in any of the older files are left out
+    # Returns the number of states written and the number dropped
+    merged = heapq.merge(*[read_keys(run, width) for run in runs])
+    seen = heapq.merge(*[read_keys(layer, width) for layer in older])
+    old = next(seen, None)
+    last = -1
+    written = 0
+    dropped = 0
+    with open(filename, "wb") as f:
+        out = []
+        for key in merged:
+            state = key >> 3
+            while old is not None and old >> 3 < state:
+                old = next(seen, None)
+            if state == last or (old is not None and old >> 3 == state):
+                dropped += 1
+                continue
+            last = state
+            out.append(key.to_bytes(width, "big"))
+            written += 1
+            if len(out) >= EXTERNAL_WRITE:
+                f.write(b"".join(out))
+                out = []
+        f.write(b"".join(out))
+    return written, dropped
+
+
+def find_key(filename, state, width):
+    # Binary search a layer file for a state, returns its key or None
+    count = os.path.getsize(filename) // width
+    with open(filename, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            low, high = 0, count
+            while low < high:
+                middle = (low + high) // 2
+                key = int.from_bytes(data[middle * width : (middle + 1) * width], "big")
+                if key >> 3 < state:
+                    low = middle + 1
+                else:
+                    high = middle
+            if low < count:
+                key = int.from_bytes(data[low * width : (low + 1) * width], "big")
+                if key >> 3 == state:
+                    return key
+    return None
+
+
+def external_path(layers, g, state, h_func, width):
+    # Follow the stored moves back from state (at depth g) to the root
+    # Each parent is in one of the layers at (g - 1, h of the parent)
+    dim = SETTINGS["matrix_dim"]
+    offsets = [-dim, dim, -1, 1]
+    path = [state]
+    while g > 0:
+        for layer in layers[(g, h_func(state))]:
+            key = find_key(layer, state, width)
+            if key is not None:
+                break
+        # The blank moved in direction code to get here, so step it back
+        blank = find_blank(state)
+        state = slide(state, blank, blank - offsets[(key & 7) - 1])
+        path.append(state)
+        g -= 1
+    path.reverse()
+    return path
+
+
+def bfida_star(puzzle, solve_state, h_func):
+    # Breadth-First Iterative-Deepening A* (Zhou & Hansen 2006)
+    # Breadth first heuristic search (bfhs_layers) with an f bound, and
+    # when a pass fails the bound grows to the smallest f over it, like
+    # IDA*. Only a few layers are kept instead of every state seen, and
+    # there are no parent pointers: the path is rebuilt by divide and
+    # conquer (bfhs_path). Every node past the middle layer carries the
+    # middle state it came from, so when the goal is found that state
+    # splits the path in two, and each half is searched for the same way.
+    # The halves cost more searching, but memory stays at the widest few
+    # layers. The path is optimal like a_star.
+
+    delta = HEURISTIC_DELTAS.get(h_func)
+    root_h, stats, expand, heuristic = search_hooks(h_func, puzzle)
+    hooks = (stats, expand, heuristic)
+    try:
+        path = bfhs_path(puzzle, solve_state, root_h, h_func, delta, hooks)
+    except BudgetExceeded:
+        stats.stop("budget")
+        return None
+    if path is None:
+        stats.stop("exhausted")
+        return None
+    stats.stop()
+    return path
+
+
+def bfhs_path(start, target, bound, h_func, delta, hooks):
+    # Shortest path from start to target as a list of states, None if none
+    # h_func and delta are the heuristic toward target. bound is the first
+    # f bound tried, it grows until a pass reaches target. hooks is
+    # (stats, expand, heuristic) from search_hooks.
+    while True:
+        verbose(f"BFHS bound: {bound}\n", 2)
+        depth, middle, next_bound = bfhs_layers(start, target, bound, h_func, delta, hooks)
+        if depth is not None:
+            break
+        if next_bound is None:
+            return None
+        bound = next_bound
+
+    if depth == 0:
+        return [start]
+    if depth == 1:
+        return [start, target]
+    if middle is None:
+        # The target came before the middle layer, which only happens when
+        # h overestimates (pnld): search again with depth as the bound and
+        # an admissible heuristic, so the target is found at that depth
+        if h_func is h3_pnld:
+            h_func, delta = h2_manhattan, HEURISTIC_DELTAS[h2_manhattan]
+        return bfhs_path(start, target, depth, h_func, delta, hooks)
+
+    # The halves are optimal paths of known length, so with an admissible
+    # heuristic the first bound tried is the one that finds them. The
+    # first half needs a heuristic toward the middle state (manhattan,
+    # or misplaced for misplaced, see target_heuristic).
+    half = bound // 2
+    if h_func is h3_pnld:
+        to_middle, to_middle_delta = target_heuristic(h2_manhattan, middle)
+    else:
+        to_middle, to_middle_delta = target_heuristic(h_func, middle)
+    first = bfhs_path(start, middle, half, to_middle, to_middle_delta, hooks)
+    second = bfhs_path(middle, target, depth - half, h_func, delta, hooks)
+    return first + second[1:]
+
+
+def bfhs_layers(start, target, bound, h_func, delta, hooks):
+    # Breadth first heuristic search from start to target, pruning f > bound
+    # Layers are dicts of state -> (h, blank, last move, middle state).
+    # The tile graph is undirected and bipartite, so a child is either in
+    # the layer before its parent's or new (or already in the next layer):
+    # the previous, current and next layers are all that is kept.
+    # The middle layer is at depth bound // 2: its states are their own
+    # middle state, and the layers after it pass theirs down.
+    # Returns (depth, middle, None) when target is reached at depth, with
+    # middle None if depth is not past the middle layer, or
+    # (None, None, next bound) when it is not, next bound None if nothing
+    # was pruned.
+    stats, expand, heuristic = hooks
+    half = bound // 2
+    start_h = h_func(start)
+    if start_h > bound:
+        return None, None, start_h
+    if start == target:
+        return 0, None, None
+    previous = {}
+    layer = {start: (start_h, find_blank(start), -1, start if half == 0 else None)}
+    next_bound = None
+    depth = 0
+    while len(layer) > 0:
+        next_layer = {}
+        for state, (h, blank, last, middle) in layer.items():
+            if stats.limited and stats.over_budget():
+                raise BudgetExceeded()
+            stats.expanded += 1
+            for move in expand(state, blank, last):
+                stats.generated += 1
+                child = move[0]
+                if child in previous or child in next_layer:
+                    stats.duplicates += 1
+                    continue
+                child_h = heuristic(h_func, delta, h, move)
+                f = depth + 1 + child_h
+                if f > bound:
+                    if next_bound is None or f < next_bound:
+                        next_bound = f
+                    continue
+                child_middle = child if depth + 1 == half else middle
+                if child == target:
+                    if depth + 1 <= half:
+                        return depth + 1, None, None
+                    return depth + 1, child_middle, None
+                next_layer[child] = (child_h, move[2], move[4], child_middle)
+        previous = layer
+        layer = next_layer
+        depth += 1
+        if len(previous) + len(layer) > stats.peak_frontier:
+            stats.peak_frontier = len(previous) + len(layer)
+    return None, None, next_bound
+
+
+# Heuristics and algorithms in the order of the -H and -a options
+HEURISTICS = [
+    h1_misplaced,
+    h2_manhattan,
+    h3_pnld,
+    h4_pdb,
+    h5_linear_conflict,
+    h6_walking_distance,
+    h7_perfect,
+]
+ALGORITHMS = [
+    best_first_search,
+    a_star,
+    ida_star,
+    perfect_search,
+    bidirectional_mm,
+    ara_star,
+    hda_star,
+    parallel_ida_star,
+    external_a_star,
+    bfida_star,
+]
+
+
+class BudgetExceeded(Exception):
+    # Raised inside a recursive search to unwind when it runs out of budget
+    pass
+
+
+def new_stats():
+    # Start the metrics for a new search, kept for show_stats and the report
+    stats = SearchStats()
+    SETTINGS["search_stats"] = stats
+    return stats
+
+
+def search_hooks(h_func, state, batch=False):
+    # Start a search: returns (h of state, stats, expand, heuristic)
+    # The first h may build lookup tables, so it runs before the metrics
+    # start. expand and heuristic make a node's children and their h
+    # (successors and child_heuristic, or with batch the numpy versions),
+    # and with --stats they are timed versions of those.
+    root_h = h_func(state)
+    expand, heuristic = successors, child_heuristic
+    if batch:
+        get_batch_tables()
+        expand, heuristic = expand_batch, batch_heuristic
+    stats = new_stats()
+    if SETTINGS["stats"]:
+        if expand is successors:
+            # The list version, so making the children is what is timed
+            expand = successor_list
+        expand = timed(expand, stats, "movegen")
+        heuristic = timed(heuristic, stats, "heuristic")
+    return root_h, stats, expand, heuristic
+
+
+class SearchStats:
+    # Metrics of one search
+    # generated: children created, expanded: nodes whose moves were made
+    # duplicates: children or frontier entries dropped as already seen
+    # peak_frontier: largest frontier (IDA*: deepest path)
+    # per_direction: nodes expanded by each side of a bidirectional search
+    # bound: how far from optimal the path can be (anytime search only)
+    # cancel: (flags, slot) of a --serve request, stops the search when set
+    # error: why a solve could not run, with status error (see solve_task)
+    # peak_rss_kb: peak memory of the process that ran the search, taken
+    # by solve_task (None until then)
+    # times: seconds in each part of the search, only measured with --stats
+    PARTS = ["movegen", "heuristic", "hashing", "queue"]
+
+    def __init__(self):
+        self.generated = 0
+        self.expanded = 0
+        self.duplicates = 0
+        self.peak_frontier = 0
+        self.per_direction = {}
+        self.bound = None
+        self.times = {part: 0.0 for part in self.PARTS}
+        self.status = "running"
+        self.time_limit = SETTINGS.get("time_limit", 0)
+        self.node_limit = SETTINGS.get("node_limit", 0)
+        self.cancel = SETTINGS.get("cancel")
+        self.limited = self.time_limit > 0 or self.node_limit > 0
+        self.limited = self.limited or self.cancel is not None
+        self.start = time.perf_counter()
+        self.elapsed = 0.0
+        self.peak_rss_kb = None
+        self.error = None
+        return
+
+    def stop(self, status="solved"):
+        # status is solved, exhausted (no solution), budget (out of limits)
+    # or error (could not run)
+        self.status = status
+        self.elapsed = time.perf_counter() - self.start
+        return
+
+    def over_budget(self):
+        # True once the search used up its time or node limit, or was cancelled
+        if self.cancel is not None and self.cancel[0][self.cancel[1]]:
+            return True
+        if self.node_limit > 0 and self.expanded >= self.node_limit:
+            return True
+        if self.time_limit > 0:
+            return time.perf_counter() - self.start >= self.time_limit
+        return False
+
+    def nodes_per_sec(self):
+        if self.elapsed == 0:
+            return 0.0
+        return self.expanded / self.elapsed
+
+    def as_dict(self):
+        values = {
+            "status": self.status,
+            "generated": self.generated,
+            "expanded": self.expanded,
+            "duplicates": self.duplicates,
+            "peak_frontier": self.peak_frontier,
+            "time": round(self.elapsed, 6),
+            "nodes_per_sec": round(self.nodes_per_sec(), 1),
+        }
+        for name, count in self.per_direction.items():
+            values[f"expanded_{name}"] = count
+        if self.bound is not None:
+            values["bound"] = round(self.bound, 3)
+        if self.error is not None:
+            values["error"] = self.error
+        if SETTINGS.get("stats"):
+            for part in self.PARTS:
+                values[f"time_{part}"] = round(self.times[part], 6)
+        return values
+
+    def line(self):
+        # Single line form for the report
+        return " ".join(f"{key}={value}" for key, value in self.as_dict().items())
+
+    def summary(self):
+        # Multi line form for --stats
+        lines = [
+            f"Status: {self.status}",
+            f"Nodes generated: {self.generated}",
+            f"Nodes expanded: {self.expanded}",
+        ]
+        for name, count in self.per_direction.items():
+            lines.append(f"  {name}: {count}")
+        lines += [
+            f"Duplicates pruned: {self.duplicates}",
+            f"Peak frontier: {self.peak_frontier}",
+            f"Time: {self.elapsed:.3f}s",
+            f"Nodes/sec: {self.nodes_per_sec():.0f}",
+        ]
+        if self.bound is not None:
+            lines.append(f"Suboptimality bound: {self.bound:.3f}")
+        for part in self.PARTS:
+            share = 0.0
+            if self.elapsed > 0:
+                share = 100 * self.times[part] / self.elapsed
+            lines.append(f"  {part}: {self.times[part]:.3f}s ({share:.1f}%)")
+        return lines
+
+
+def timed(func, stats, part):
+    # Wrap func so the time spent in it is added to stats.times[part]
+    # Only used with --stats, so the plain search pays nothing for it
+    times = stats.times
+
+    def wrapper(*args):
+        start = time.perf_counter()
+        result = func(*args)
+        times[part] += time.perf_counter() - start
+        return result
+
+    return wrapper
+
+
+class TimedSet(set):
+    # Set that adds the time of its lookups to the hashing stats
+    def __init__(self, stats, items=()):
+        super().__init__(items)
+        self.times = stats.times
+        return
+
+    def __contains__(self, key):
+        start = time.perf_counter()
+        result = set.__contains__(self, key)
+        self.times["hashing"] += time.perf_counter() - start
+        return result
+
+    def add(self, key):
+        start = time.perf_counter()
+        set.add(self, key)
+        self.times["hashing"] += time.perf_counter() - start
+        return
+
+    def discard(self, key):
+        start = time.perf_counter()
+        set.discard(self, key)
+        self.times["hashing"] += time.perf_counter() - start
+        return
+
+
+class TimedDict(dict):
+    # Dictionary that adds the time of its lookups to the hashing stats
+    def __init__(self, stats, items=()):
+        super().__init__(items)
+        self.times = stats.times
+        return
+
+    def __contains__(self, key):
+        start = time.perf_counter()
+        result = dict.__contains__(self, key)
+        self.times["hashing"] += time.perf_counter() - start
+        return result
+
+    def __getitem__(self, key):
+        start = time.perf_counter()
+        result = dict.__getitem__(self, key)
+        self.times["hashing"] += time.perf_counter() - start
+        return result
+
+    def __setitem__(self, key, value):
+        start = time.perf_counter()
+        dict.__setitem__(self, key, value)
+        self.times["hashing"] += time.perf_counter() - start
+        return
+
+    def get(self, key, default=None):
+        start = time.perf_counter()
+        result = dict.get(self, key, default)
+        self.times["hashing"] += time.perf_counter() - start
+        return result
+
+
+class TimedQueue:
+    # Frontier wrapper that adds the time of push and pop to the queue stats
+    def __init__(self, queue, stats):
+        self.queue = queue
+        self.times = stats.times
+        return
+
+    def __len__(self):
+        return len(self.queue)
+
+    def push(self, f, h, item):
+        start = time.perf_counter()
+        self.queue.push(f, h, item)
+        self.times["queue"] += time.perf_counter() - start
+        return
+
+    def push_many(self, fs, hs, items):
+        start = time.perf_counter()
+        self.queue.push_many(fs, hs, items)
+        self.times["queue"] += time.perf_counter() - start
+        return
+
+    def pop(self):
+        start = time.perf_counter()
+        item = self.queue.pop()
+        self.times["queue"] += time.perf_counter() - start
+        return item
+
+    def pop_many(self, count):
+        start = time.perf_counter()
+        items = self.queue.pop_many(count)
+        self.times["queue"] += time.perf_counter() - start
+        return items
+
+    def min_key(self):
+        return self.queue.min_key()
+
+    def items(self):
+        return self.queue.items()
+
+
+def make_queue():
+    # Create the frontier queue chosen on the command line
+    return QUEUES[SETTINGS["queue"]](SETTINGS["tie_break"])
+
+
+class HeapQueue:
+    # Binary heap frontier
+    # Entries are tuples, so the heap never calls back into Python to
+    # compare nodes. The counter makes every key unique and sets the order
+    # of equal f entries: lower h first (then newest), newest or oldest.
+    def __init__(self, tie_break):
+        self.heap = []
+        self.count = 0
+        self.tie_break = tie_break
+        return
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, f, h, item):
+        self.count += 1
+        if self.tie_break == "h":
+            heapq.heappush(self.heap, (f, h, -self.count, item))
+        elif self.tie_break == "lifo":
+            heapq.heappush(self.heap, (f, 0, -self.count, item))
+        else:
+            heapq.heappush(self.heap, (f, 0, self.count, item))
+        return
+
+    def push_many(self, fs, hs, items):
+        # push for every (f, h, item) in order
+        heap = self.heap
+        count = self.count
+        if self.tie_break == "h":
+            for f, h, item in zip(fs, hs, items):
+                count += 1
+                heapq.heappush(heap, (f, h, -count, item))
+        else:
+            sign = -1 if self.tie_break == "lifo" else 1
+            for f, item in zip(fs, items):
+                count += 1
+                heapq.heappush(heap, (f, 0, sign * count, item))
+        self.count = count
+        return
+
+    def pop(self):
+        return heapq.heappop(self.heap)[-1]
+
+    def pop_many(self, count):
+        # Up to count items, in the order pop would return them
+        heap = self.heap
+        return [heapq.heappop(heap)[-1] for _ in range(min(count, len(heap)))]
+
+    def min_key(self):
+        # Lowest f in the queue, the queue must not be empty
+        return self.heap[0][0]
+
+    def items(self):
+        # Every item still in the queue, in no particular order
+        return [entry[-1] for entry in self.heap]
+
+
+class BucketQueue:
+    # Bucket frontier for small integer priorities
+    # buckets[f] holds every entry with that f, and low only moves up until
+    # something with a lower f is pushed, so push and pop are O(1).
+    # With the h tie break each bucket is split again by h, [count, low, lists]
+    # Otherwise each bucket is a deque used as a stack (lifo) or queue (fifo)
+    def __init__(self, tie_break):
+        self.buckets = []
+        self.low = 0
+        self.size = 0
+        self.tie_break = tie_break
+        return
+
+    def __len__(self):
+        return self.size
+
+    def push(self, f, h, item):
+        while len(self.buckets) <= f:
+            self.buckets.append(None)
+        bucket = self.buckets[f]
+
+        if self.tie_break == "h":
+            if bucket is None:
+                bucket = [0, h, []]
+                self.buckets[f] = bucket
+            lists = bucket[2]
+            while len(lists) <= h:
+                lists.append([])
+            lists[h].append(item)
+            bucket[0] += 1
+            if h < bucket[1]:
+                bucket[1] = h
+        else:
+            if bucket is None:
+                bucket = deque()
+                self.buckets[f] = bucket
+            bucket.append(item)
+
+        if f < self.low:
+            self.low = f
+        self.size += 1
+        return
+
+    def push_many(self, fs, hs, items):
+        # push for every (f, h, item) in order
+        for f, h, item in zip(fs, hs, items):
+            self.push(f, h, item)
+        return
+
+    def pop(self):
+        if self.size == 0:
+            raise IndexError("pop from an empty queue")
+        self.size -= 1
+
+        if self.tie_break == "h":
+            bucket = self.buckets[self.low]
+            while bucket is None or bucket[0] == 0:
+                self.low += 1
+                bucket = self.buckets[self.low]
+            lists = bucket[2]
+            while len(lists[bucket[1]]) == 0:
+                bucket[1] += 1
+            bucket[0] -= 1
+            return lists[bucket[1]].pop()
+
+        bucket = self.buckets[self.low]
+        while bucket is None or len(bucket) == 0:
+            self.low += 1
+            bucket = self.buckets[self.low]
+        if self.tie_break == "lifo":
+            return bucket.pop()
+        return bucket.popleft()
+
+    def pop_many(self, count):
+        # Up to count items, in the order pop would return them
+        return [self.pop() for _ in range(min(count, self.size))]
+
+    def min_key(self):
+        # Lowest f in the queue, the queue must not be empty
+        while True:
+            bucket = self.buckets[self.low]
+            if bucket is not None:
+                count = bucket[0] if self.tie_break == "h" else len(bucket)
+                if count > 0:
+                    return self.low
+            self.low += 1
+
+
+QUEUES = {"heap": HeapQueue, "bucket": BucketQueue}
+TIE_BREAKS = ["h", "lifo", "fifo"]
+
+
+class NodePool:
+    # Node store for the A* and Best First Search algorithms
+    # Instead of one object per node, every field is its own array and a
+    # node is just an index into them (struct of arrays).
+    # state[i]: packed state (array of 64 bit ints when the board fits)
+    # g[i]: steps taken to get to this node, h[i]: heuristic value
+    # blank[i]: position of the blank, so expanding never scans for it
+    # parent[i]: index of the parent node, -1 for the root
+    # move[i]: direction the blank moved to get here (see MOVES), -1 for root
+    def __init__(self):
+        if SETTINGS["size"] * SETTINGS["tile_bits"] <= 64:
+            self.state = array("Q")
+        else:
+            self.state = []
+        self.g = array("H")
+        self.h = array("H")
+        self.blank = array("H")
+        self.parent = array("q")
+        self.move = array("b")
+        return
+
+    def __len__(self):
+        return len(self.state)
+
+    def add(self, state, g, h, blank, parent=-1, move=-1):
+        # Add a node and return its index
+        self.state.append(state)
+        self.g.append(g)
+        self.h.append(h)
+        self.blank.append(blank)
+        self.parent.append(parent)
+        self.move.append(move)
+        return len(self.state) - 1
+
+    def extend(self, states, g, h, blank, parent, move):
+        # Add many nodes at once, each argument a list or numpy array
+        # Returns the index of the first one, the others follow it in order
+        first = len(self.state)
+        self.state.extend(states)
+        for field, values in [
+            (self.g, g),
+            (self.h, h),
+            (self.blank, blank),
+            (self.parent, parent),
+            (self.move, move),
+        ]:
+            if hasattr(values, "astype"):
+                field.frombytes(values.astype(field.typecode).tobytes())
+            else:
+                field.extend(values)
+        return first
 
-    def __gte__(self, other):
-        return self.f >= other.f
+    def path(self, index):
+        # Rebuild the list of states from the root to this node
+        solution = []
+        while index >= 0:
+            solution.append(self.state[index])
+            index = self.parent[index]
+        solution.reverse()
+        return solution
 
 
 if __name__ == "__main__":